@@ -0,0 +1,103 @@
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import time
+import zlib
+from datetime import datetime
+
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Сколько страниц базы копирует один шаг онлайн-бэкапа и пауза между шагами:
+# копия идёт небольшими порциями и не забирает диск у запросов бота
+BACKUP_PAGES = int(os.getenv('BACKUP_PAGES', '1000'))
+BACKUP_STEP_SLEEP = float(os.getenv('BACKUP_STEP_SLEEP', '0.005'))
+# Сколько последних снимков хранить и степень сжатия gzip (1 — быстро, 9 — компактно)
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', '24'))
+BACKUP_COMPRESSLEVEL = int(os.getenv('BACKUP_COMPRESSLEVEL', '6'))
+
+SNAPSHOT_PREFIX = 'waiters-'
+SNAPSHOT_SUFFIX = '.db.gz'
+COPY_CHUNK = 1024 * 1024
+
+def list_snapshots(backup_dir):
+    # Имена содержат время создания, поэтому сортировка по имени — от старых к новым
+    try:
+        names = os.listdir(backup_dir)
+    except FileNotFoundError:
+        return []
+    return [
+        os.path.join(backup_dir, name) for name in sorted(names)
+        if name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX)
+    ]
+
+def _copy_database(db_path, raw_path, pages, step_sleep):
+    src = sqlite3.connect(db_path, timeout=30)
+    dst = sqlite3.connect(raw_path)
+    try:
+        # Открытая читающая транзакция фиксирует снимок: в WAL запись в базу не ждёт копию,
+        # а копия не начинается заново после каждой чужой записи
+        src.execute('BEGIN')
+        src.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+
+        def pause(status, remaining, total):
+            if remaining and step_sleep:
+                time.sleep(step_sleep)
+
+        src.backup(dst, pages=pages, progress=pause)
+        src.rollback()
+        check = dst.execute('PRAGMA quick_check').fetchone()[0]
+        if check != 'ok':
+            raise sqlite3.DatabaseError(f"Копия базы повреждена: {check}")
+    finally:
+        dst.close()
+        src.close()
+
+def _rotate(backup_dir, keep):
+    for path in list_snapshots(backup_dir)[:-keep]:
+        os.remove(path)
+
+@timed
+def create_snapshot(db_path, backup_dir, keep=BACKUP_KEEP, pages=BACKUP_PAGES, step_sleep=BACKUP_STEP_SLEEP):
+    # Блокирующая функция (запускать в отдельном потоке): онлайн-копия через backup API,
+    # проверка копии, сжатие и ротация. Возвращает путь к новому снимку
+    os.makedirs(backup_dir, exist_ok=True)
+    path = os.path.join(backup_dir, f"{SNAPSHOT_PREFIX}{datetime.now():%Y%m%d-%H%M%S}{SNAPSHOT_SUFFIX}")
+    raw_path = f"{path}.{os.getpid()}.raw"
+    part_path = f"{path}.{os.getpid()}.part"
+    try:
+        _copy_database(db_path, raw_path, pages, step_sleep)
+        with open(raw_path, 'rb') as src, gzip.open(part_path, 'wb', compresslevel=BACKUP_COMPRESSLEVEL) as dst:
+            shutil.copyfileobj(src, dst, COPY_CHUNK)
+        # Снимок появляется под своим именем только целиком
+        os.replace(part_path, path)
+    finally:
+        for tmp in (raw_path, part_path):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    _rotate(backup_dir, keep)
+    return path
+
+def restore_latest_snapshot(db_path, backup_dir):
+    # Быстрый путь при старте на пустом томе: распаковываем последний целый снимок вместо
+    # пустой базы. Битые снимки пропускаются. Возвращает путь к снимку или None
+    part_path = f"{db_path}.restore"
+    for snapshot in reversed(list_snapshots(backup_dir)):
+        try:
+            with gzip.open(snapshot, 'rb') as src, open(part_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK)
+        except (OSError, EOFError, zlib.error) as e:
+            logger.error(f"❌ Снимок {snapshot} не читается: {e}")
+            continue
+        # Журналы WAL от прежней базы к восстановленной не относятся
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        os.replace(part_path, db_path)
+        return snapshot
+    if os.path.exists(part_path):
+        os.remove(part_path)
+    return None
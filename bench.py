@@ -0,0 +1,451 @@
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Лимит Telegram в бенчмарках не нужен: замеряем хендлеры и базу, а не ожидание токенов.
+# Задаётся до импорта sender.py; воркеры кластера получают его через окружение
+os.environ.setdefault('SEND_GLOBAL_RATE', '1000000')
+
+from aiogram import BaseMiddleware, Bot, Dispatcher, F, Router
+from aiogram.client.session.base import BaseSession
+from aiogram.filters import Command, StateFilter
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Chat, Message, Update
+
+import database
+from keyboards import BTN_ADMIN_PANEL, BTN_BACK, BTN_BLACKLIST, BTN_EXPORT, BTN_HELP, BTN_IMPORT, BTN_MY_DATA, BTN_SEARCH, BTN_STATS, BTN_UPDATE_MEDBOOK
+from metrics import handler_name
+from routing import HandlerTable, UserIdFilter, button_text, callback_prefix, dispatch
+from sender import FloodControlMiddleware
+
+# Нагрузочные сценарии для базы и бота. Запуск: python bench.py writes --users 2000
+# или python bench.py cluster --users 500 --workers 1 2 4
+# или python bench.py replay --rows 1000 100000 --save before.json (затем --baseline before.json)
+def use_temp_db(profile):
+    path = os.path.join(tempfile.mkdtemp(prefix='waiterbot-bench-'), 'waiters.db')
+    database.close_db()
+    database.DB_PATH = path
+    # Через окружение путь получают и процессы, запущенные бенчмарком (воркеры кластера)
+    os.environ['DB_PATH'] = path
+    os.environ['FSM_DB_PATH'] = os.path.join(os.path.dirname(path), 'fsm.db')
+    database.DB_PROFILE = profile
+    database.init_db()
+    return path
+
+def report(name, count, elapsed):
+    print(f"{name:<40} {count:>8} записей  {elapsed:8.3f} с  {count / elapsed:10.0f} записей/с")
+
+def bench_writes_per_connection(users):
+    # Как было раньше: отдельное соединение и отдельный COMMIT на каждую регистрацию
+    path = use_temp_db('safe')
+    started = time.perf_counter()
+    for i in range(users):
+        conn = sqlite3.connect(path, timeout=30)
+        conn.execute('''
+            INSERT OR REPLACE INTO staff
+            (telegram_id, full_name, birth_date, phone, medbook_status, medbook_expiry, consent_given, updated_at)
+            VALUES (?, ?, ?, ?, 'действует', ?, 1, CURRENT_TIMESTAMP)
+        ''', (i, f'Официант {i}', '1990-01-01', '+79990000000', '2030-01-01'))
+        conn.commit()
+        conn.close()
+    report('sqlite3.connect на каждую запись', users, time.perf_counter() - started)
+
+async def bench_writes_queue(users, profile):
+    # Параллельные завершения FSM: все add_staff_async попадают в общие транзакции
+    use_temp_db(profile)
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        database.add_staff_async(i, f'Официант {i}', '1990-01-01', '+79990000000', '2030-01-01')
+        for i in range(users)
+    ))
+    elapsed = time.perf_counter() - started
+    report(f'очередь писателя, профиль {profile}', users, elapsed)
+    total, _, _ = database.get_staff_stats()
+    assert total == users, f'ожидалось {users} записей, в базе {total}'
+    database.close_db()
+
+class FakeSession(BaseSession):
+    # Сессия бота без сети: каждый вызов Bot API «отвечает» через latency секунд
+    def __init__(self, latency=0.0):
+        super().__init__()
+        self.latency = latency
+
+    async def make_request(self, bot, method, timeout=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method.__class__.__name__ in ('SendMessage', 'SendDocument', 'EditMessageText'):
+            chat_id = getattr(method, 'chat_id', None) or 1
+            return Message(message_id=1, date=datetime.now(), chat=Chat(id=chat_id, type='private'), text=getattr(method, 'text', None))
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        yield b''
+
+    async def close(self):
+        pass
+
+def message_update(update_id, user_id, text):
+    return Update.model_validate({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': 0, 'text': text,
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Bench'},
+        },
+    })
+
+def callback_update(update_id, user_id, data):
+    return Update.model_validate({
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id), 'chat_instance': 'bench', 'data': data,
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Bench'},
+            'message': {'message_id': 1, 'date': 0, 'text': 'bench', 'chat': {'id': user_id, 'type': 'private'}},
+        },
+    })
+
+def registration_funnel(user_id):
+    # Полная регистрация официанта: шесть сообщений подряд
+    return ['/start', 'Согласен', f'Официантов Бенч {user_id}', '01.01.1990', f'+7999{user_id:07d}', '01.01.2030']
+
+async def bench_cluster_run(workers, users, latency):
+    from cluster import ShardedFeeder
+
+    use_temp_db('wal')
+    feeder = ShardedFeeder(workers, session_factory=functools.partial(FakeSession, latency))
+    await feeder.start()
+    # Апдейты разных пользователей перемешаны, как в реальном потоке
+    updates = []
+    for step in range(6):
+        for user_id in range(1, users + 1):
+            updates.append(message_update(len(updates) + 1, user_id, registration_funnel(user_id)[step]))
+    started = time.perf_counter()
+    for update in updates:
+        await feeder.feed_update(None, update)
+    await feeder.stop()
+    elapsed = time.perf_counter() - started
+    print(f"{'воркеров: ' + str(workers):<40} {len(updates):>8} апдейтов {elapsed:8.3f} с  {len(updates) / elapsed:10.0f} апдейтов/с")
+    total, _, _ = database.get_staff_stats()
+    assert total == users, f'ожидалось {users} регистраций, в базе {total}'
+    database.close_db()
+
+def cmd_cluster(args):
+    os.environ.setdefault('BOT_TOKEN', '123456:bench')
+    os.environ['ADMIN_IDS'] = '0'
+    os.environ['REMINDER_DAYS'] = ''
+    for workers in args.workers:
+        asyncio.run(bench_cluster_run(workers, args.users, args.latency))
+
+SURNAMES = ('Иванов', 'Петров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Соколов', 'Михайлов',
+            'Новиков', 'Фёдоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семёнов', 'Егоров')
+FIRST_NAMES = ('Иван', 'Пётр', 'Алексей', 'Сергей', 'Дмитрий', 'Андрей', 'Михаил', 'Николай')
+PATRONYMICS = ('Иванович', 'Петрович', 'Сергеевич', 'Андреевич', 'Олегович', 'Юрьевич')
+# telegram_id засеянных официантов начинаются отсюда, чтобы не пересекаться с новыми регистрациями
+SEED_ID_BASE = 10 ** 7
+REPLAY_ADMIN_ID = 999
+
+def seed_staff(rows, batch=10000):
+    # Засев базы через тот же пакетный импорт, что и загрузка файлов админом
+    rnd = random.Random(rows)
+    today = datetime.now().date().toordinal()
+    started = time.perf_counter()
+    for start in range(0, rows, batch):
+        database.import_staff([
+            (
+                SEED_ID_BASE + i,
+                f'{rnd.choice(SURNAMES)} {rnd.choice(FIRST_NAMES)} {rnd.choice(PATRONYMICS)} {i}',
+                datetime.fromordinal(today - rnd.randint(18 * 365, 60 * 365)).date().isoformat(),
+                f'+79{i:09d}',
+                datetime.fromordinal(today + rnd.randint(-365, 2 * 365)).date().isoformat(),
+                1,
+            )
+            for i in range(start, min(start + batch, rows))
+        ])
+    print(f"Засеяно {rows} официантов за {time.perf_counter() - started:.1f} с")
+
+class HandlerTimer(BaseMiddleware):
+    # Точное время каждого вызова хендлера (гистограммы metrics.py дают только границы корзин)
+    def __init__(self):
+        self.samples = {}
+
+    async def __call__(self, handler, event, data):
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.samples.setdefault(handler_name(data), []).append(time.perf_counter() - started)
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+class Replay:
+    # Гонит синтетические апдейты через настоящий router бота с фейковой сессией Bot API
+    def __init__(self, app, concurrency):
+        self.app = app
+        self.concurrency = concurrency
+        self.update_id = 0
+        self.timer = HandlerTimer()
+        app.router.message.middleware(self.timer)
+        app.router.callback_query.middleware(self.timer)
+
+    def next_id(self):
+        self.update_id += 1
+        return self.update_id
+
+    async def message(self, user_id, text):
+        await self.app.dp.feed_update(self.app.bot, message_update(self.next_id(), user_id, text))
+
+    async def callback(self, user_id, data):
+        await self.app.dp.feed_update(self.app.bot, callback_update(self.next_id(), user_id, data))
+
+    async def phase(self, name, scripts):
+        # scripts — корутины-сценарии отдельных пользователей; одновременно идут concurrency из них
+        self.timer.samples = {}
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def run(script):
+            async with slots:
+                await script
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run(script) for script in scripts))
+        elapsed = time.perf_counter() - started
+        result = {}
+        for handler, values in self.timer.samples.items():
+            values.sort()
+            result[handler] = {
+                'n': len(values),
+                'p50_ms': percentile(values, 0.5) * 1000,
+                'p99_ms': percentile(values, 0.99) * 1000,
+                'max_ms': values[-1] * 1000,
+                'per_sec': len(values) / elapsed,
+            }
+        updates = sum(item['n'] for item in result.values())
+        print(f"\n{name}: {updates} апдейтов за {elapsed:.2f} с ({updates / elapsed:.0f} апдейтов/с)")
+        return result
+
+    async def register(self, user_id):
+        for text in registration_funnel(user_id):
+            await self.message(user_id, text)
+
+    async def update_medbook(self, user_id):
+        await self.message(user_id, '🔄 Обновить медкнижку')
+        await self.message(user_id, '01.01.2031')
+
+    async def search(self, surname):
+        await self.message(REPLAY_ADMIN_ID, surname)
+        await self.callback(REPLAY_ADMIN_ID, f'search_page:{self.app.SEARCH_PAGE_SIZE}')
+
+    async def export(self):
+        await self.message(REPLAY_ADMIN_ID, '📤 Выгрузить всех')
+        await self.callback(REPLAY_ADMIN_ID, 'export:all:csv')
+
+def print_phase(result, baseline=None):
+    print(f"  {'хендлер':<28} {'n':>7} {'p50, мс':>9} {'p99, мс':>9} {'max, мс':>9} {'вызовов/с':>10}")
+    for handler, item in sorted(result.items()):
+        line = f"  {handler:<28} {item['n']:>7} {item['p50_ms']:>9.2f} {item['p99_ms']:>9.2f} {item['max_ms']:>9.2f} {item['per_sec']:>10.0f}"
+        if baseline and handler in baseline:
+            line += f"  p99 {(item['p99_ms'] / baseline[handler]['p99_ms'] - 1) * 100:+.0f}%"
+        print(line)
+
+async def bench_replay_run(replay, rows, args, baseline):
+    use_temp_db('wal')
+    seed_staff(rows)
+    database.staff_cache.clear()
+    await replay.app.blacklist_screen.load()
+    rnd = random.Random(0)
+    phases = {
+        'registration': [replay.register(user_id) for user_id in range(1, args.users + 1)],
+        'medbook': [replay.update_medbook(SEED_ID_BASE + rnd.randrange(rows)) for _ in range(args.users)],
+        # Поиск и выгрузка — от одного админа, по очереди: FSM админа хранит последний запрос
+        'search': [replay.search(rnd.choice(SURNAMES)) for _ in range(args.searches)],
+        'export': [replay.export() for _ in range(args.exports)],
+    }
+    results = {}
+    for name, scripts in phases.items():
+        replay.concurrency = 1 if name in ('search', 'export') else args.concurrency
+        results[name] = await replay.phase(f'{rows} строк · {name}', scripts)
+        print_phase(results[name], (baseline.get(str(rows)) or {}).get(name))
+    database.close_db()
+    return results
+
+async def bench_replay(args):
+    os.environ.setdefault('BOT_TOKEN', '123456:bench')
+    os.environ['ADMIN_IDS'] = str(REPLAY_ADMIN_ID)
+    os.environ['REMINDER_DAYS'] = ''
+    os.environ['FSM_DB_PATH'] = os.path.join(tempfile.mkdtemp(prefix='waiterbot-bench-'), 'fsm.db')
+    import bot as app
+    # Логи каждого апдейта заметно искажают замеры
+    logging.getLogger().setLevel(logging.WARNING)
+    app.bot.session = FakeSession(args.latency)
+    app.bot.session.middleware(FloodControlMiddleware(app.notifier))
+    app.dp.include_router(app.router)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    replay = Replay(app, args.concurrency)
+    results = {}
+    for rows in args.rows:
+        results[str(rows)] = await bench_replay_run(replay, rows, args, baseline)
+    await app.storage.close()
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+        print(f"\nРезультаты сохранены в {args.save}")
+
+def cmd_replay(args):
+    asyncio.run(bench_replay(args))
+
+# Маршрутизация: цена выбора хендлера на апдейт, без базы и Bot API
+ROUTING_ADMIN_ID = 42
+
+class RoutingStates(StatesGroup):
+    one = State()
+    two = State()
+
+async def noop(*args, **kwargs):
+    pass
+
+def legacy_router():
+    # Цепочка фильтров в порядке bot.py до табличной маршрутизации: каждое сообщение
+    # проверяется подряд подстрочным поиском и регэкспами, права админа — внутри хендлеров
+    r = Router()
+    r.message(Command('start'))(noop)
+    for _ in range(6):
+        r.message(RoutingStates.one)(noop)
+    for text in ('Мои данные', 'Обновить медкнижку'):
+        r.message(F.text.contains(text))(noop)
+    r.message(RoutingStates.two)(noop)
+    for text in ('Админ-панель', 'Поиск по фамилии'):
+        r.message(F.text.contains(text))(noop)
+    r.message(StateFilter(None), F.text.regexp(r'^[А-Яа-яЁё\s\-]+$|^\+?[\d\s\-()]+$'))(noop)
+    r.message(Command('perf'))(noop)
+    for text in ('Статистика', 'Выгрузить всех', 'Импорт из файла'):
+        r.message(F.text.contains(text))(noop)
+    r.message(RoutingStates.two, F.document)(noop)
+    r.message(RoutingStates.two)(noop)
+    r.message(F.text.contains('Чёрный список'))(noop)
+    for _ in range(4):
+        r.message(RoutingStates.two)(noop)
+    r.message(F.text.regexp(r'^[А-Яа-яЁё\s\-]+$'))(noop)
+    for text in ('Назад', 'Помощь'):
+        r.message(F.text.contains(text))(noop)
+    for prefix in ('search_page:', 'export:', 'import:', 'bl_page:'):
+        r.callback_query(F.data.startswith(prefix))(noop)
+    for data in ('blacklist_add', 'blacklist_remove'):
+        r.callback_query(F.data == data)(noop)
+    return r
+
+def table_router():
+    # Та же нагрузка в устройстве bot.py: админ-подроутер с одной проверкой прав и таблицы меню
+    async def handler(event, state):
+        pass
+
+    admin_menu = HandlerTable(button_text)
+    admin_callbacks = HandlerTable(callback_prefix)
+    user_menu = HandlerTable(button_text)
+    for key in (BTN_SEARCH, BTN_STATS, BTN_EXPORT, BTN_BLACKLIST, BTN_IMPORT, BTN_ADMIN_PANEL, BTN_MY_DATA, BTN_UPDATE_MEDBOOK, BTN_HELP, BTN_BACK):
+        admin_menu.register(key)(handler)
+    for key in ('search_page', 'export', 'import', 'bl_page', 'blacklist_add', 'blacklist_remove'):
+        admin_callbacks.register(key)(handler)
+    for key in (BTN_ADMIN_PANEL, BTN_MY_DATA, BTN_UPDATE_MEDBOOK, BTN_HELP, BTN_BACK):
+        user_menu.register(key)(handler)
+
+    root = Router()
+    admin = Router()
+    admin.message.filter(UserIdFilter({ROUTING_ADMIN_ID}))
+    admin.callback_query.filter(UserIdFilter({ROUTING_ADMIN_ID}))
+    admin.message(admin_menu)(dispatch)
+    admin.callback_query(admin_callbacks)(dispatch)
+    admin.message(Command('perf'))(noop)
+    for _ in range(6):
+        admin.message(RoutingStates.two)(noop)
+    admin.message(StateFilter(None), F.text)(noop)
+    user = Router()
+    user.message(user_menu)(dispatch)
+    user.message(Command('start'))(noop)
+    for _ in range(7):
+        user.message(RoutingStates.one)(noop)
+    user.callback_query()(noop)
+    root.include_routers(admin, user)
+    return root
+
+def routing_updates(count):
+    # Смесь: кнопки начала и конца меню, поиск по фамилии, произвольный текст от не-админа, inline-кнопки
+    texts = [BTN_MY_DATA, BTN_HELP, BTN_BACK, BTN_STATS, BTN_BLACKLIST, 'Иванов', 'привет, когда смена?']
+    updates = []
+    for i in range(count):
+        user_id = ROUTING_ADMIN_ID if i % 3 == 0 else 1000 + i % 50
+        if i % 5 == 4:
+            updates.append(callback_update(i + 1, user_id, random.choice(('bl_page:10', 'export:all', 'blacklist_remove'))))
+        else:
+            updates.append(message_update(i + 1, user_id, random.choice(texts)))
+    return updates
+
+async def bench_routing_run(name, router, updates, bot):
+    dp = Dispatcher(storage=MemoryStorage())
+    dp.include_router(router)
+    for update in updates[:200]:
+        await dp.feed_update(bot, update)
+    started = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<40} {len(updates):>8} апдейтов {elapsed:8.3f} с  {elapsed / len(updates) * 1e6:10.1f} мкс/апдейт")
+
+async def bench_routing(args):
+    random.seed(args.updates)
+    updates = routing_updates(args.updates)
+    bot = Bot('123456:bench', session=FakeSession(0))
+    await bench_routing_run('цепочка фильтров (до)', legacy_router(), updates, bot)
+    await bench_routing_run('таблицы + админ-подроутер (после)', table_router(), updates, bot)
+    await bot.session.close()
+
+def cmd_routing(args):
+    asyncio.run(bench_routing(args))
+
+def cmd_writes(args):
+    bench_writes_per_connection(args.users)
+    for profile in ('safe', 'wal'):
+        asyncio.run(bench_writes_queue(args.users, profile))
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочные тесты waiterbot')
+    sub = parser.add_subparsers(dest='command', required=True)
+    writes = sub.add_parser('writes', help='пропускная способность регистраций')
+    writes.add_argument('--users', type=int, default=2000)
+    writes.set_defaults(func=cmd_writes)
+    cluster = sub.add_parser('cluster', help='апдейтов/с в зависимости от числа процессов-воркеров')
+    cluster.add_argument('--users', type=int, default=500)
+    cluster.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    cluster.add_argument('--latency', type=float, default=0.0, help='имитация задержки Bot API, с')
+    cluster.set_defaults(func=cmd_cluster)
+    replay = sub.add_parser('replay', help='задержки хендлеров bot.py на засеянных базах')
+    replay.add_argument('--rows', type=int, nargs='+', default=[1000, 100000, 1000000], help='размеры засеянной базы')
+    replay.add_argument('--users', type=int, default=500, help='регистраций и обновлений медкнижки')
+    replay.add_argument('--searches', type=int, default=200)
+    replay.add_argument('--exports', type=int, default=3)
+    replay.add_argument('--concurrency', type=int, default=50, help='пользователей одновременно')
+    replay.add_argument('--latency', type=float, default=0.0, help='имитация задержки Bot API, с')
+    replay.add_argument('--save', help='сохранить результаты в JSON')
+    replay.add_argument('--baseline', help='JSON прошлого прогона: покажет изменение p99')
+    replay.set_defaults(func=cmd_replay)
+    routing = sub.add_parser('routing', help='стоимость выбора хендлера на апдейт: цепочка фильтров против таблиц')
+    routing.add_argument('--updates', type=int, default=20000)
+    routing.set_defaults(func=cmd_routing)
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,32 +1,70 @@
 import asyncio
 import os
 import sys
-from datetime import datetime, timedelta
+import tempfile
+from datetime import date, datetime, timedelta
 import logging
-import sqlite3
 
 from aiogram import Bot, Dispatcher, Router, F
-from aiogram.types import Message, CallbackQuery
-from aiogram.filters import Command
+from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 import dotenv
 
 # Импорт из database.py (должен быть в том же каталоге)
-from database import init_db, add_staff, update_medbook, get_staff_by_surname, get_all_staff, get_expiring_medbooks, add_to_blacklist, get_blacklist, remove_from_blacklist, staff_exists, get_staff_stats
-from database import DB_PATH
-# Убедимся, что /app существует (для persistent volume Railway)
-os.makedirs('/app', exist_ok=True)
-
+from database import init_db, close_db, run_db, staff_cache, blacklist_keys
+from database import (
+    add_staff_async, update_medbook_async, search_staff_async, get_staff_by_id_async,
+    add_to_blacklist_async, get_blacklist_page_async, get_staff_stats_async,
+    remove_from_blacklist_async, staff_exists_async, get_stats_summary_async, has_consent_async, give_consent_async,
+    sweep_expired_medbooks_async, snapshot_stats_async, run_data_migrations_async,
+    backup_db_async, get_latest_backup,
+    create_event_async, get_event_async, get_upcoming_events_async, count_eligible_staff_async,
+    answer_invite_async, get_invite_counts_async, get_event_attendees_async,
+    archive_expired_staff_async, search_archive_async, get_archived_staff_async, reactivate_staff_async,
+)
+from fsm_storage import FSM_TTL, SQLiteStorage
+from cluster import BOT_WORKERS, run_cluster
+from screening import blacklist_screen
+from sender import SEND_GLOBAL_RATE, FloodControlMiddleware, RateLimitedSender
+from reminders import ReminderScheduler
+from events import invite_kb, invite_text, send_invites
+from tasks import PeriodicTask
+from webhook import run_webhook
+from metrics import MetricsMiddleware, format_perf_report, start_metrics_server
+from importer import ImportFileError, import_file, write_error_report
+from export import export_staff, get_export_filters, xlsx_available
+from utils import validate_date, validate_phone, format_date_for_db, format_date_for_user, format_phone_for_db
+from routing import HandlerTable, UserIdFilter, button_text, callback_prefix, dispatch
+from keyboards import (
+    ADMIN_KB, CANCEL_KB, CONSENT_KB, IMPORT_TARGET_KB, MAIN_ADMIN_KB, MAIN_KB, inline_keyboard,
+    BTN_ADMIN_PANEL, BTN_BACK, BTN_BLACKLIST, BTN_EVENTS, BTN_EXPORT, BTN_HELP, BTN_IMPORT, BTN_MY_DATA, BTN_SEARCH,
+    BTN_STATS, BTN_UPDATE_MEDBOOK,
+)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 dotenv.load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN')
-ADMIN_IDS = [int(x.strip()) for x in os.getenv('ADMIN_IDS', '').split(',') if x.strip()]
+ADMIN_IDS = frozenset(int(x.strip()) for x in os.getenv('ADMIN_IDS', '').split(',') if x.strip())
 REMINDER_DAYS = [int(x.strip()) for x in os.getenv('REMINDER_DAYS', '14,3').split(',') if x.strip()]
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', '10'))
+SWEEP_INTERVAL = int(os.getenv('SWEEP_INTERVAL', '3600'))
+# Как часто переносить давно просроченных официантов в архив (секунды)
+ARCHIVE_INTERVAL = int(os.getenv('ARCHIVE_INTERVAL', str(24 * 3600)))
+# Как часто делать снимок базы (секунды); 0 — не делать
+BACKUP_INTERVAL = int(os.getenv('BACKUP_INTERVAL', '3600'))
+# Больше Bot API не даёт отправить ботом: такой снимок админ забирает с тома сам
+TELEGRAM_UPLOAD_LIMIT = 50 * 1024 * 1024
+# Где хранить состояния FSM: sqlite (переживают рестарт, общий файл для всех воркеров кластера),
+# redis (нужен пакет redis и REDIS_URL) или memory
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'sqlite')
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+# Как получать апдейты: polling (long polling) или webhook (aiohttp-сервер, см. webhook.py)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
 
 if not BOT_TOKEN:
     logger.error("❌ Не указан BOT_TOKEN!")
@@ -36,9 +74,83 @@ if not ADMIN_IDS:
     logger.warning("⚠️ Не указаны ADMIN_IDS")
 
 bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+
+def create_storage():
+    if FSM_STORAGE == 'sqlite':
+        return SQLiteStorage()
+    if FSM_STORAGE == 'redis':
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(REDIS_URL, state_ttl=FSM_TTL, data_ttl=FSM_TTL)
+    return MemoryStorage()
+
+storage = create_storage()
 dp = Dispatcher(storage=storage)
-router = Router()
+# Корневой роутер: сначала админский (ADMIN_IDS проверяется один раз на апдейт фильтром роутера),
+# затем общий. Апдейты админа, которые админский роутер не обработал, доходят до общего.
+# Middleware корневого роутера действуют и на вложенные
+router = Router(name='root')
+admin_router = Router(name='admin')
+user_router = Router(name='user')
+router.include_routers(admin_router, user_router)
+router.message.middleware(MetricsMiddleware())
+router.callback_query.middleware(MetricsMiddleware())
+admin_router.message.filter(UserIdFilter(ADMIN_IDS))
+admin_router.callback_query.filter(UserIdFilter(ADMIN_IDS))
+# Кнопки меню и inline-кнопки — поиском в таблице; таблицы проверяются раньше остальных хендлеров
+admin_menu = HandlerTable(button_text)
+admin_callbacks = HandlerTable(callback_prefix)
+user_menu = HandlerTable(button_text)
+user_callbacks = HandlerTable(callback_prefix)
+admin_router.message(admin_menu)(dispatch)
+admin_router.callback_query(admin_callbacks)(dispatch)
+user_router.message(user_menu)(dispatch)
+user_router.callback_query(user_callbacks)(dispatch)
+# Единый отправитель: ответы хендлеров (через middleware сессии), напоминания и уведомления админам
+# делят один лимит Telegram. В кластере лимит бота делится между фронтом и воркерами
+notifier = RateLimitedSender(bot, global_rate=SEND_GLOBAL_RATE / (BOT_WORKERS + 1) if BOT_WORKERS > 1 else SEND_GLOBAL_RATE)
+notifier.register_metrics()
+bot.session.middleware(FloodControlMiddleware(notifier))
+reminder_scheduler = ReminderScheduler(bot, REMINDER_DAYS, sender=notifier)
+# Ссылки на фоновые задачи, чтобы их не собрал GC до завершения
+background_tasks = set()
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+async def sweep_expired():
+    swept = await sweep_expired_medbooks_async()
+    if swept:
+        logger.info(f"⚠️ Медкнижек переведено в «просрочена»: {swept}")
+
+expiry_sweeper = PeriodicTask('medbook-sweep', SWEEP_INTERVAL, sweep_expired)
+
+async def archive_expired():
+    archived = await archive_expired_staff_async()
+    if archived:
+        logger.info(f"🗄 Перенесено в архив: {archived}")
+
+staff_archiver = PeriodicTask('staff-archive', ARCHIVE_INTERVAL, archive_expired)
+
+async def expire_fsm_sessions():
+    expired = await storage.expire()
+    if expired:
+        logger.info(f"🧹 Удалено брошенных сессий FSM: {expired}")
+
+async def save_stats_snapshot():
+    await snapshot_stats_async()
+
+# Снимок счётчиков раз в час перезаписывает сегодняшнюю строку stats_history — из них считаются тренды
+stats_snapshots = PeriodicTask('stats-snapshot', 3600, save_stats_snapshot)
+
+fsm_cleaner = PeriodicTask('fsm-expire', 3600, expire_fsm_sessions) if isinstance(storage, SQLiteStorage) else None
+
+async def save_backup():
+    path = await backup_db_async()
+    logger.info(f"💾 Снимок базы: {path} ({os.path.getsize(path) // 1024} КБ)")
+
+backup_task = PeriodicTask('db-backup', BACKUP_INTERVAL, save_backup) if BACKUP_INTERVAL else None
 
 class Registration(StatesGroup):
     consent = State()
@@ -49,97 +161,99 @@ class Registration(StatesGroup):
 
 class UpdateMedbook(StatesGroup):    medbook_expiry = State()
 
+class BulkImport(StatesGroup):
+    document = State()
+
 class BlacklistAdd(StatesGroup):
     full_name = State()
     phone = State()
     birth_date = State()
     reason = State()
 
+class BlacklistRemove(StatesGroup):
+    full_name = State()
+
+class EventCreate(StatesGroup):
+    title = State()
+    event_date = State()
+    headcount = State()
+
 def is_admin(telegram_id):
     return telegram_id in ADMIN_IDS
 
-def validate_date(date_text):
-    try:
-        datetime.strptime(date_text, '%d.%m.%Y')
-        return True
-    except ValueError:
-        return False
+def main_kb(telegram_id):
+    return MAIN_ADMIN_KB if is_admin(telegram_id) else MAIN_KB
 
-def validate_phone(phone):
-    phone = phone.replace(' ', '').replace('-', '').replace('(', '').replace(')', '')
-    return phone.startswith('+7') and len(phone) == 12 and phone[2:].isdigit()
+async def notify_admins(text):
+    await asyncio.gather(*(notifier.send(admin_id, text) for admin_id in ADMIN_IDS))
 
-def format_date_for_db(date_text):
-    d = datetime.strptime(date_text, '%d.%m.%Y')
-    return d.strftime('%Y-%m-%d')
+async def screen_registration(message: Message, state: FSMContext):
+    # Сверка с ЧС на каждом шаге регистрации. Без совпадений — только поиск в словарях в памяти;
+    # о совпадении админы узнают из фонового уведомления, регистрация при этом не ждёт
+    data = await state.get_data()
+    matches = await blacklist_screen.check(data.get('full_name'), data.get('phone'), data.get('birth_date'))
+    reported = set(data.get('blacklist_reported', []))
+    new_matches = [match for match in matches if match[0] not in reported]
+    if not new_matches:
+        return
+    await state.update_data(blacklist_reported=sorted(reported | {match[0] for match in new_matches}))
+    user = message.from_user
+    text = (
+        f"🚨 Регистрация похожа на запись из ЧС\n\n"
+        f"Кто: {data.get('full_name', '—')} (ID: {user.id}, @{user.username or '—'})\n"
+        f"ДР: {data.get('birth_date', '—')}, тел.: {data.get('phone', '—')}\n\n"
+    )
+    for _, bl_name, bl_phone, bl_birth, reason, signs in new_matches:
+        text += f"• {bl_name} ({bl_phone or 'нет телефона'}, ДР {format_date_for_user(bl_birth) if bl_birth else '—'})\n  Совпадает: {', '.join(signs)}\n  Причина ЧС: {reason}\n"
+    logger.warning(f"Совпадение с ЧС при регистрации {user.id}: {[match[1] for match in new_matches]}")
+    run_in_background(notify_admins(text))
 
-def format_date_for_user(date_text):
-    try:
-        d = datetime.strptime(date_text, '%Y-%m-%d')
-        return d.strftime('%d.%m.%Y')
-    except:
-        return date_text
-
-def create_main_kb(is_admin=False):
-    buttons = [
-        [KeyboardButton(text="👤 Мои данные")],
-        [KeyboardButton(text="🔄 Обновить медкнижку")],
-        [KeyboardButton(text="ℹ️ Помощь")]
-    ]
-    if is_admin:
-        buttons.insert(0, [KeyboardButton(text="👑 Админ-панель")])
-    return ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
-
-def create_admin_kb():
-    buttons = [
-        [KeyboardButton(text="🔍 Поиск по фамилии")],
-        [KeyboardButton(text="📊 Статистика")],
-        [KeyboardButton(text="📤 Выгрузить всех")],
-        [KeyboardButton(text="🚫 Чёрный список")],
-        [KeyboardButton(text="⬅️ Назад")]    ]
-    return ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
-
-@router.message(Command("start"))
+@user_router.message(Command("start"))
 async def cmd_start(message: Message, state: FSMContext):
     user_id = message.from_user.id
     if is_admin(user_id):
-        await message.answer("👑 Вы администратор.", reply_markup=create_main_kb(is_admin=True))
-        return
-    if staff_exists(user_id):
-        await message.answer("✅ Вы уже зарегистрированы!", reply_markup=create_main_kb())
+        await message.answer("👑 Вы администратор.", reply_markup=MAIN_ADMIN_KB)
         return
+    if await staff_exists_async(user_id):
+        if await has_consent_async(user_id):
+            await message.answer("✅ Вы уже зарегистрированы!", reply_markup=MAIN_KB)
+            return
+        # Внесён админом из файла без согласия: спрашиваем только согласие, данные уже есть
+        await state.update_data(consent_only=True)
     await state.set_state(Registration.consent)
     await message.answer(
         "👋 Добро пожаловать!\n\n"
         "Подтвердите согласие на обработку Персональных Данных:\n"
         "— ФИО\n— Дата рождения\n— Телефон\n— Данные о медкнижке\n\n"
         "Напишите 'Согласен' для продолжения.",
-        reply_markup=ReplyKeyboardMarkup(
-            keyboard=[[KeyboardButton(text="Согласен")]],
-            resize_keyboard=True,
-            one_time_keyboard=True
-        )
+        reply_markup=CONSENT_KB
     )
 
-@router.message(Registration.consent)
+@user_router.message(Registration.consent)
 async def process_consent(message: Message, state: FSMContext):
     if message.text.lower().strip() not in ['согласен', 'согласна']:
         await message.answer("Напишите 'Согласен' для продолжения.")
         return
+    if (await state.get_data()).get('consent_only'):
+        await state.clear()
+        await give_consent_async(message.from_user.id)
+        await message.answer("✅ Согласие сохранено. Вы зарегистрированы!", reply_markup=MAIN_KB)
+        return
     await state.set_state(Registration.full_name)
     await message.answer("👤 Введите ФИО:")
     
 
-@router.message(Registration.full_name)
+@user_router.message(Registration.full_name)
 async def process_name(message: Message, state: FSMContext):
     if len(message.text.strip()) < 5:
         await message.answer("ФИО должно содержать минимум 5 символов:")
         return
     await state.update_data(full_name=message.text.strip())
+    await screen_registration(message, state)
     await state.set_state(Registration.birth_date)
     await message.answer("📅 Дата рождения ДД.ММ.ГГГГ:")
 
-@router.message(Registration.birth_date)
+@user_router.message(Registration.birth_date)
 async def process_birth_date(message: Message, state: FSMContext):
     if not validate_date(message.text.strip()):
         await message.answer("Неверный формат. Укажите ДД.ММ.ГГГГ:")
@@ -150,20 +264,22 @@ async def process_birth_date(message: Message, state: FSMContext):
         await message.answer("Возраст должен быть не менее 18 лет:")        
         return
     await state.update_data(birth_date=message.text.strip())
+    await screen_registration(message, state)
     await state.set_state(Registration.phone)
     await message.answer("📱 Телефон +79991234567:")
 
-@router.message(Registration.phone)
+@user_router.message(Registration.phone)
 async def process_phone(message: Message, state: FSMContext):
     phone = message.text.strip().replace(' ', '')
     if not validate_phone(phone):
         await message.answer("Неверный формат. Укажите +79991234567:")
         return
-    await state.update_data(phone=phone)
+    await state.update_data(phone=format_phone_for_db(phone))
+    await screen_registration(message, state)
     await state.set_state(Registration.medbook_expiry)
     await message.answer("⚕️ Дата окончания медкнижки ДД.ММ.ГГГГ:")
 
-@router.message(Registration.medbook_expiry)
+@user_router.message(Registration.medbook_expiry)
 async def process_medbook(message: Message, state: FSMContext):
     if not validate_date(message.text.strip()):
         await message.answer("Неверный формат. Укажите ДД.ММ.ГГГГ:")
@@ -174,7 +290,7 @@ async def process_medbook(message: Message, state: FSMContext):
         return
     data = await state.get_data()
     medbook_db = format_date_for_db(message.text.strip())
-    success = add_staff(
+    success = await add_staff_async(
         telegram_id=message.from_user.id,
         full_name=data['full_name'],
         birth_date=format_date_for_db(data['birth_date']),
@@ -188,30 +304,22 @@ async def process_medbook(message: Message, state: FSMContext):
             f"Дата рождения: {data['birth_date']}\n"
             f"Телефон: {data['phone']}\n"
             f"Медкнижка до: {message.text.strip()}\n\n"
-            "Напоминания за 14 и 3 дня до окончания.",
-            reply_markup=create_main_kb()
+            f"Напоминания за {' и '.join(map(str, sorted(REMINDER_DAYS, reverse=True)))} дн. до окончания.",
+            reply_markup=MAIN_KB
         )
         logger.info(f"Новый официант: {data['full_name']} (ID: {message.from_user.id})")
     else:
-        await message.answer("❌ Ошибка сохранения данных.", reply_markup=create_main_kb())
+        await message.answer("❌ Ошибка сохранения данных.", reply_markup=MAIN_KB)
     await state.clear()
 
-@router.message(F.text.contains("Мои данные"))
-async def my_data(message: Message):    
-    if not staff_exists(message.from_user.id):
-        await message.answer("❌ Вы не зарегистрированы. Нажмите /start")
-        return
-    
-    # Используем функцию из database.py вместо ручного запроса
-    conn = sqlite3.connect(DB_PATH)  # ← временно, но лучше создать get_staff_by_id в database.py
-    cursor = conn.cursor()
-    cursor.execute('SELECT full_name, birth_date, phone, medbook_status, medbook_expiry FROM staff WHERE telegram_id = ?', (message.from_user.id,))
-    data = cursor.fetchone()
-    conn.close()
+@admin_menu.register(BTN_MY_DATA)
+@user_menu.register(BTN_MY_DATA)
+async def my_data(message: Message, state: FSMContext):
+    data = await get_staff_by_id_async(message.from_user.id)
     if not data:
-        await message.answer("❌ Ваши данные не найдены.")
+        await message.answer("❌ Вы не зарегистрированы. Нажмите /start")
         return
-    name, birth, phone, status, expiry = data
+    name, birth, phone, status, expiry, consent = data
     status_text = {'действует': '✅ Действует', 'просрочена': '❌ Просрочена', 'оформляется': '🔄 Оформляется'}.get(status, status)
     await message.answer(
         f"📋 Ваши данные:\n\n"
@@ -222,198 +330,632 @@ async def my_data(message: Message):
         "Для обновления — нажмите «🔄 Обновить медкнижку»"
     )
 
-@router.message(F.text.contains("Обновить медкнижку"))
+@admin_menu.register(BTN_UPDATE_MEDBOOK)
+@user_menu.register(BTN_UPDATE_MEDBOOK)
 async def update_medbook_start(message: Message, state: FSMContext):
-    if not staff_exists(message.from_user.id):
+    if not await staff_exists_async(message.from_user.id):
         await message.answer("❌ Вы не зарегистрированы. Нажмите /start")
         return
     await state.set_state(UpdateMedbook.medbook_expiry)
     await message.answer("⚕️ Новая дата окончания ДД.ММ.ГГГГ:")
 
-@router.message(UpdateMedbook.medbook_expiry)
+@user_router.message(UpdateMedbook.medbook_expiry)
 async def update_medbook_process(message: Message, state: FSMContext):
     if not validate_date(message.text.strip()):
         await message.answer("Неверный формат. Укажите ДД.ММ.ГГГГ:")
         return
     expiry_db = format_date_for_db(message.text.strip())
-    update_medbook(message.from_user.id, expiry_db)
-    await message.answer(f"✅ Срок обновлён до {message.text.strip()}", reply_markup=create_main_kb())
+    await update_medbook_async(message.from_user.id, expiry_db)
+    await message.answer(f"✅ Срок обновлён до {message.text.strip()}", reply_markup=main_kb(message.from_user.id))
     await state.clear()
 
-@router.message(F.text.contains("Админ-панель"))
-async def admin_panel(message: Message):
-    if not is_admin(message.from_user.id):
-        await message.answer("❌ У вас нет прав администратора.")
+@admin_menu.register(BTN_ADMIN_PANEL)
+async def admin_panel(message: Message, state: FSMContext):
+    await message.answer("👑 Админ-панель", reply_markup=ADMIN_KB)
+
+# До общего меню админ-кнопка доходит только от не-админов (например, со старой клавиатурой)
+@user_menu.register(BTN_ADMIN_PANEL)
+async def admin_panel_denied(message: Message, state: FSMContext):
+    await message.answer("❌ У вас нет прав администратора.")
+
+@admin_menu.register(BTN_SEARCH)
+async def search_start(message: Message, state: FSMContext):
+    await message.answer("🔍 Введите фамилию:")
+
+def render_search_page(total, results, offset):
+    text = f"📋 Найдено {total} сотрудников"
+    if total > SEARCH_PAGE_SIZE:
+        text += f" (показаны {offset + 1}–{offset + len(results)})"
+    text += ":\n\n"
+    for i, (name, birth, phone, status, expiry) in enumerate(results, offset + 1):
+        status_emoji = '✅' if status == 'действует' else ('❌' if status == 'просрочена' else '🔄')
+        text += f"{i}. {name}\n   ДР: {format_date_for_user(birth)}\n   Тел: {phone}\n   Медкнижка: {status_emoji} до {format_date_for_user(expiry)}\n\n"
+    nav = []
+    if offset > 0:
+        nav.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"search_page:{max(offset - SEARCH_PAGE_SIZE, 0)}"))
+    if offset + SEARCH_PAGE_SIZE < total:
+        nav.append(InlineKeyboardButton(text="Дальше ▶️", callback_data=f"search_page:{offset + SEARCH_PAGE_SIZE}"))
+    keyboard = [nav] if nav else []
+    keyboard.append([InlineKeyboardButton(text="🗄 Искать в архиве", callback_data="archive_search")])
+    return text, InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+# Только вне сценариев FSM — иначе поиск перехватывал бы ввод ФИО и телефона при добавлении в ЧС
+@admin_router.message(StateFilter(None), F.text.regexp(r'^[А-Яа-яЁё\s\-]+$|^\+?[\d\s\-()]+$'))
+async def search_process(message: Message, state: FSMContext):
+    query = message.text.strip()
+    total, results = await search_staff_async(query, limit=SEARCH_PAGE_SIZE)
+    # Запрос запоминаем в FSM, чтобы кнопки страниц и поиска в архиве не упирались в лимит callback_data
+    await state.update_data(search_query=query)
+    if not results:
+        await message.answer("❌ Ничего не найдено.", reply_markup=ARCHIVE_SEARCH_KB)
         return
-    await message.answer("👑 Админ-панель", reply_markup=create_admin_kb())
+    text, kb = render_search_page(total, results, 0)
+    await message.answer(text, reply_markup=kb)
 
-@router.message(F.text.contains("Поиск по фамилии"))
-async def search_start(message: Message):    
-    if not is_admin(message.from_user.id):        
+@admin_callbacks.register("search_page")
+async def search_page(callback: CallbackQuery, state: FSMContext):
+    query = (await state.get_data()).get('search_query')
+    if not query:
+        await callback.answer("Поиск устарел, введите фамилию заново.")
         return
-    await message.answer("🔍 Введите фамилию:")
+    offset = int(callback.data.split(':', 1)[1])
+    total, results = await search_staff_async(query, limit=SEARCH_PAGE_SIZE, offset=offset)
+    await callback.answer()
+    if not results:
+        return
+    text, kb = render_search_page(total, results, offset)
+    await callback.message.edit_text(text, reply_markup=kb)
 
-@router.message(F.text.regexp(r'^[А-Яа-яЁё\s\-]+$'))
-async def search_process(message: Message):
-    if not is_admin(message.from_user.id):
+# Архив ищется только по явной кнопке: обычный поиск идёт лишь по рабочей таблице
+ARCHIVE_SEARCH_KB = inline_keyboard([("🗄 Искать в архиве", "archive_search")])
+
+@admin_callbacks.register("archive_search")
+async def archive_search(callback: CallbackQuery, state: FSMContext):
+    query = (await state.get_data()).get('search_query')
+    if not query:
+        await callback.answer("Поиск устарел, введите фамилию заново.")
         return
-    surname = message.text.strip()
-    results = get_staff_by_surname(surname)
+    total, results = await search_archive_async(query, limit=SEARCH_PAGE_SIZE)
+    await callback.answer()
     if not results:
-        await message.answer("❌ Ничего не найдено.")
+        await callback.message.answer("🗄 В архиве ничего не найдено.")
         return
-    text = f"📋 Найдено {len(results)} сотрудников:\n\n"
-    for i, (name, birth, phone, status, expiry) in enumerate(results, 1):
-        status_emoji = '✅' if status == 'действует' else ('❌' if status == 'просрочена' else '🔄')
-        text += f"{i}. {name}\n   ДР: {format_date_for_user(birth)}\n   Тел: {phone}\n   Медкнижка: {status_emoji} до {format_date_for_user(expiry)}\n\n"
-    await message.answer(text)
+    text = f"🗄 В архиве найдено {total}"
+    if total > len(results):
+        text += f" (показаны первые {len(results)}, уточните запрос)"
+    text += ":\n\n"
+    rows = []
+    for i, (telegram_id, name, birth, phone, expiry, archived_at, reason) in enumerate(results, 1):
+        text += f"{i}. {name}\n   ДР: {format_date_for_user(birth)}\n   Тел: {phone}\n   Медкнижка до {format_date_for_user(expiry)}\n   В архиве с {format_date_for_user(archived_at[:10])}: {reason}\n\n"
+        rows.append([(f"♻️ {i}. Вернуть: {name}", f"archive_restore:{telegram_id}")])
+    await callback.message.answer(text, reply_markup=inline_keyboard(*rows))
+
+@admin_callbacks.register("archive_restore")
+async def archive_restore(callback: CallbackQuery, state: FSMContext):
+    telegram_id = int(callback.data.split(':')[1])
+    row = await get_archived_staff_async(telegram_id)
+    if row is None:
+        await callback.answer("Уже не в архиве")
+        return
+    _, name, birth, phone, *_ = row
+    # Человек из ЧС не возвращается в базу, пока его не уберут из ЧС
+    matches = await blacklist_screen.check(name, phone, birth)
+    if matches:
+        await callback.answer(f"🚫 Совпадает с записью ЧС: {matches[0][1]}. Сначала удалите её из ЧС.", show_alert=True)
+        return
+    name = await reactivate_staff_async(telegram_id)
+    if name is None:
+        await callback.answer("Уже не в архиве")
+        return
+    await callback.answer(f"✅ {name} снова в базе")
+    logger.info(f"Админ {callback.from_user.id} вернул из архива: {name} ({telegram_id})")
 
-@router.message(F.text.contains("Статистика"))
-async def show_stats(message: Message):
-    if not is_admin(message.from_user.id):
+@admin_router.message(Command("perf"))
+async def perf_report(message: Message):
+    cache = staff_cache.stats()
+    await message.answer(
+        format_perf_report()
+        + f"\n🧠 Кэш профилей: {cache['size']} записей, попаданий {cache['hit_rate']:.0%} "
+        f"({cache['hits']}/{cache['hits'] + cache['misses']})"
+    )
+
+@admin_router.message(Command("backup"))
+async def backup_send(message: Message):
+    path = get_latest_backup()
+    if path is None:
+        await message.answer("⏳ Снимков ещё нет, создаём...")
+        path = await backup_db_async()
+    size = os.path.getsize(path)
+    created = datetime.fromtimestamp(os.path.getmtime(path)).strftime('%d.%m.%Y %H:%M')
+    if size > TELEGRAM_UPLOAD_LIMIT:
+        await message.answer(f"⚠️ Снимок от {created} весит {size // (1024 * 1024)} МБ — больше лимита Telegram.\nФайл на сервере: {path}")
         return
-    total, expired, blacklisted = get_staff_stats()
-    await message.answer(f"📊 Статистика:\n\n👥 Активных: {total}\n⚠️ Просрочена: {expired}\n🚫 В ЧС: {blacklisted}")
+    await message.answer_document(
+        FSInputFile(path, filename=os.path.basename(path)),
+        caption=f"💾 Снимок базы от {created}, {size // 1024} КБ"
+    )
 
-@router.message(F.text.contains("Выгрузить всех"))
-async def export_all(message: Message):
-    if not is_admin(message.from_user.id):
+def format_trend(current, previous):
+    delta = current - previous
+    return f" ({'+' if delta >= 0 else ''}{delta} за неделю)" if delta else ""
+
+@admin_menu.register(BTN_STATS)
+async def show_stats(message: Message, state: FSMContext):
+    stats = await get_stats_summary_async(REMINDER_DAYS)
+    _, prev_total, prev_active, prev_expired, prev_blacklisted = stats['previous'] or (None, stats['total'], stats['active'], stats['expired'], stats['blacklisted'])
+    text = (
+        "📊 Статистика:\n\n"
+        f"👥 Всего: {stats['total']}{format_trend(stats['total'], prev_total)}\n"
+        f"✅ Медкнижка действует: {stats['active']}{format_trend(stats['active'], prev_active)}\n"
+        f"⚠️ Просрочена: {stats['expired']}{format_trend(stats['expired'], prev_expired)}\n"
+    )
+    if stats['pending']:
+        text += f"🔄 Оформляется: {stats['pending']}\n"
+    text += f"🚫 В ЧС: {stats['blacklisted']}{format_trend(stats['blacklisted'], prev_blacklisted)}\n"
+    if stats['archived']:
+        text += f"🗄 В архиве: {stats['archived']}\n"
+    if stats['expiring']:
+        text += "\n⏳ Истекает медкнижка:\n"
+        for days, count in stats['expiring'].items():
+            text += f"— в ближайшие {days} дн.: {count}\n"
+    text += "\n📈 Регистрации за неделю:\n"
+    for day, count in stats['registrations']:
+        text += f"{format_date_for_user(day)[:5]}: {count}\n"
+    await message.answer(text)
+
+# Фильтры и форматы выгрузки не меняются во время работы — клавиатура собирается один раз
+EXPORT_KB = inline_keyboard(*(
+    [(f"{title} · {fmt.upper()}", f"export:{key}:{fmt}") for fmt in (['csv', 'xlsx'] if xlsx_available() else ['csv'])]
+    for key, (title, _) in get_export_filters().items()
+))
+
+@admin_menu.register(BTN_EXPORT)
+async def export_all(message: Message, state: FSMContext):
+    await message.answer("📤 Кого выгрузить?", reply_markup=EXPORT_KB)
+
+@admin_callbacks.register("export")
+async def export_send(callback: CallbackQuery, state: FSMContext):
+    _, filter_key, fmt = callback.data.split(':')
+    if filter_key not in get_export_filters():
+        await callback.answer("Неизвестный фильтр")
         return
-    staff = get_all_staff()
-    if not staff:
-        await message.answer("❌ Нет активных официантов.")
+    await callback.answer("⏳ Готовим файл...")
+    # Файл пишется потоково во временный каталог и отправляется одним документом
+    path, count = await run_db(export_staff, filter_key, fmt)
+    try:
+        if not count:
+            await callback.message.answer("❌ Нет официантов по выбранному фильтру.")
+            return
+        title = get_export_filters()[filter_key][0]
+        filename = f"staff_{filter_key}_{datetime.now():%Y%m%d}{os.path.splitext(path)[1]}"
+        await callback.message.answer_document(
+            FSInputFile(path, filename=filename),
+            caption=f"📤 {title}: {count} чел."
+        )
+    finally:
+        os.remove(path)
+
+@admin_menu.register(BTN_IMPORT)
+async def import_start(message: Message, state: FSMContext):
+    await message.answer("📥 Что импортируем?", reply_markup=IMPORT_TARGET_KB)
+
+@admin_callbacks.register("import")
+async def import_choose(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    target = callback.data.split(':', 1)[1]
+    await state.set_state(BulkImport.document)
+    await state.update_data(import_target=target)
+    columns = (
+        "telegram_id; ФИО; Дата рождения; Телефон; Медкнижка до; Согласие\n"
+        "(«Согласие» — да/нет, получено ли согласие на обработку ПД; без него напоминания и приглашения "
+        "не отправляются, пока официант не подтвердит согласие через /start)"
+        if target == 'staff' else
+        "ФИО; Телефон; Дата рождения; Причина (телефон и дата — необязательны)"
+    )
+    await callback.message.answer(
+        f"Пришлите файл CSV{' или XLSX' if xlsx_available() else ''} с заголовком:\n{columns}\n\n"
+        "Даты — ДД.ММ.ГГГГ, телефон — +79991234567. «Отмена» — выйти.",
+        reply_markup=CANCEL_KB
+    )
+
+@admin_router.message(BulkImport.document, F.document)
+async def import_process(message: Message, state: FSMContext):
+    target = (await state.get_data()).get('import_target', 'staff')
+    await state.clear()
+    suffix = '.xlsx' if (message.document.file_name or '').lower().endswith('.xlsx') else '.csv'
+    fd, path = tempfile.mkstemp(prefix='import-', suffix=suffix)
+    os.close(fd)
+    try:
+        await bot.download(message.document, destination=path)
+        await message.answer("⏳ Импортируем...")
+        try:
+            imported, errors = await run_db(import_file, path, target, message.from_user.id, blacklist_screen.check_sync)
+        except ImportFileError as e:
+            await message.answer(f"❌ {e}", reply_markup=ADMIN_KB)
+            return
+    finally:
+        os.remove(path)
+    if target == 'blacklist' and imported:
+        await blacklist_screen.load()
+    text = f"✅ Импортировано записей: {imported}\n❌ С ошибками: {len(errors)}"
+    if errors:
+        text += "\n\n" + "\n".join(f"Строка {line}: {error}" for line, error in errors[:20])
+    await message.answer(text, reply_markup=ADMIN_KB)
+    if len(errors) > 20:
+        fd, report = tempfile.mkstemp(prefix='import-errors-', suffix='.csv')
+        os.close(fd)
+        try:
+            write_error_report(report, errors)
+            await message.answer_document(FSInputFile(report, filename='import_errors.csv'), caption="Полный список ошибок")
+        finally:
+            os.remove(report)
+    logger.info(f"Админ {message.from_user.id} импортировал {imported} записей ({target}), ошибок: {len(errors)}")
+
+@admin_router.message(BulkImport.document)
+async def import_waiting(message: Message, state: FSMContext):
+    if (message.text or '').strip().lower() == 'отмена':
+        await state.clear()
+        await message.answer("Действие отменено", reply_markup=ADMIN_KB)
         return
-    text = "ФИО | ДР | Телефон | Статус | Медкнижка до\n"
-    for name, birth, phone, status, expiry in staff:
-        text += f"{name} | {format_date_for_user(birth)} | {phone} | {status} | {format_date_for_user(expiry)}\n"
-    if len(text) > 4096:
-        parts = [text[i:i+4096] for i in range(0, len(text), 4096)]
-        for part in parts:
-            await message.answer(part)
-    else:
-        await message.answer(text)
-
-@router.message(F.text.contains("Чёрный список"))
-async def blacklist_menu(message: Message):
-    if not is_admin(message.from_user.id):
-        return
-    blacklist = get_blacklist()
-    kb = InlineKeyboardMarkup(inline_keyboard=[        [InlineKeyboardButton(text="➕ Добавить", callback_data="blacklist_add")],
-        [InlineKeyboardButton(text="🗑 Удалить запись", callback_data="blacklist_remove")]
-    ])
-    if blacklist:
-        text = f"🚫 В чёрном списке ({len(blacklist)} чел.):\n\n"
-        for i, (name, phone, reason, date) in enumerate(blacklist[:10], 1):
-            date_short = datetime.fromisoformat(date).strftime('%d.%m.%Y')
-            text += f"{i}. {name} ({phone or 'нет телефона'})\n   Причина: {reason}\n   Добавлен: {date_short}\n\n"
-        if len(blacklist) > 10:
-            text += f"... и ещё {len(blacklist) - 10} записей"
+    await message.answer("Пришлите файл документом или напишите «Отмена».")
+
+BLACKLIST_PAGE_SIZE = 10
+
+async def render_blacklist_page(cursor=None, direction='older'):
+    rows, has_more = await get_blacklist_page_async(cursor, direction, BLACKLIST_PAGE_SIZE)
+    if not rows and cursor is not None:
+        # Страница опустела (записи удалили) — показываем начало списка
+        rows, has_more = await get_blacklist_page_async(None, 'older', BLACKLIST_PAGE_SIZE)
+        cursor = None
+    _, _, total = await get_staff_stats_async()
+    if rows:
+        text = f"🚫 В чёрном списке ({total} чел.):\n\n"
+        for _, name, phone, reason, added in rows:
+            date_short = datetime.fromisoformat(added).strftime('%d.%m.%Y')
+            text += f"• {name} ({phone or 'нет телефона'})\n   Причина: {reason}\n   Добавлен: {date_short}\n\n"
     else:
         text = "✅ Чёрный список пуст"
+    # Есть ли страницы новее/старее текущей: в направлении листания — has_more, в обратном — раз пришли оттуда
+    has_newer = has_more if direction == 'newer' else cursor is not None
+    has_older = has_more if direction == 'older' else True
+    nav = []
+    if rows and has_newer:
+        first = rows[0]
+        nav.append(InlineKeyboardButton(text="◀️", callback_data=f"bl_page:newer:{first[0]}:{first[4]}"))
+    if rows and has_older:
+        last = rows[-1]
+        nav.append(InlineKeyboardButton(text="▶️", callback_data=f"bl_page:older:{last[0]}:{last[4]}"))
+    keyboard = [nav] if nav else []
+    keyboard += [
+        [InlineKeyboardButton(text="➕ Добавить", callback_data="blacklist_add")],
+        [InlineKeyboardButton(text="🗑 Удалить запись", callback_data="blacklist_remove")],
+    ]
+    return text, InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+@admin_menu.register(BTN_BLACKLIST)
+async def blacklist_menu(message: Message, state: FSMContext):
+    text, kb = await render_blacklist_page()
     await message.answer(text, reply_markup=kb)
 
-@router.callback_query(F.data == "blacklist_add")
+@admin_callbacks.register("bl_page")
+async def blacklist_page(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    _, direction, row_id, added = callback.data.split(':', 3)
+    text, kb = await render_blacklist_page((added, int(row_id)), direction)
+    # Листаем в том же сообщении, не присылая новых
+    await callback.message.edit_text(text, reply_markup=kb)
+
+@admin_callbacks.register("blacklist_add")
 async def blacklist_add_start(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
     await state.set_state(BlacklistAdd.full_name)
-    await callback.message.answer("Введите ФИО:", reply_markup=ReplyKeyboardMarkup(keyboard=[[KeyboardButton(text="Отмена")]], resize_keyboard=True))
+    await callback.message.answer("Введите ФИО:", reply_markup=CANCEL_KB)
 
-@router.message(BlacklistAdd.full_name)
+@admin_router.message(BlacklistAdd.full_name)
 async def blacklist_add_name(message: Message, state: FSMContext):
     text = message.text.strip()
     if text in ["Отмена", "отмена", "-"]:
         await state.clear()
-        await message.answer("Действие отменено", reply_markup=create_admin_kb())
+        await message.answer("Действие отменено", reply_markup=ADMIN_KB)
         return
     await state.update_data(full_name=text)
     await state.set_state(BlacklistAdd.phone)
     await message.answer("Телефон (или '-'): ")
 
-@router.message(BlacklistAdd.phone)
+@admin_router.message(BlacklistAdd.phone)
 async def blacklist_add_phone(message: Message, state: FSMContext):
     text = message.text.strip()
-    if text in ["Отмена", "отмена", "-"]:
+    if text in ["Отмена", "отмена"]:
         await state.clear()
-        await message.answer("Действие отменено", reply_markup=create_admin_kb())
+        await message.answer("Действие отменено", reply_markup=ADMIN_KB)
         return
     phone = None if text == '-' else text
     await state.update_data(phone=phone)
     await state.set_state(BlacklistAdd.birth_date)
     await message.answer("Дата рождения ДД.ММ.ГГГГ (или '-'): ")
 
-@router.message(BlacklistAdd.birth_date)
+@admin_router.message(BlacklistAdd.birth_date)
 async def blacklist_add_birth(message: Message, state: FSMContext):
     text = message.text.strip()
-    if text in ["Отмена", "отмена", "-"]:
+    if text in ["Отмена", "отмена"]:
         await state.clear()
-        await message.answer("Действие отменено", reply_markup=create_admin_kb())
+        await message.answer("Действие отменено", reply_markup=ADMIN_KB)
+        return
+    # '-' — дата неизвестна; иначе дата должна разобраться, а не молча сохраниться как NULL
+    if text != '-' and not validate_date(text):
+        await message.answer("❌ Неверный формат. Используйте ДД.ММ.ГГГГ или '-'")
         return
-    
     birth_date = None if text == '-' else text
     await state.update_data(birth_date=birth_date)
     await state.set_state(BlacklistAdd.reason)
     await message.answer("Причина добавления в ЧС:")
     
-@router.message(BlacklistAdd.reason)
+@admin_router.message(BlacklistAdd.reason)
 async def blacklist_add_reason(message: Message, state: FSMContext):
     text = message.text.strip()
     if text in ["Отмена", "отмена", "-"]:
         await state.clear()
-        await message.answer("Действие отменено", reply_markup=create_admin_kb())
+        await message.answer("Действие отменено", reply_markup=ADMIN_KB)
         return
     data = await state.get_data()
-    success = add_to_blacklist(data['full_name'], data.get('phone', ''), data.get('birth_date', ''), text, message.from_user.id)
+    success = await add_to_blacklist_async(data['full_name'], data.get('phone', ''), data.get('birth_date', ''), text, message.from_user.id)
     if success:
-        await message.answer(f"✅ {data['full_name']} добавлен в ЧС.\nПричина: {text}", reply_markup=create_admin_kb())
+        blacklist_screen.add(success, *blacklist_keys(data['full_name'], data.get('phone'), data.get('birth_date')))
+        await message.answer(f"✅ {data['full_name']} добавлен в ЧС.\nПричина: {text}", reply_markup=ADMIN_KB)
         logger.info(f"Админ {message.from_user.id} добавил в ЧС: {data['full_name']}")
     else:
-        await message.answer("❌ Ошибка добавления в ЧС", reply_markup=create_admin_kb())
+        await message.answer("❌ Ошибка добавления в ЧС", reply_markup=ADMIN_KB)
     await state.clear()
 
-@router.callback_query(F.data == "blacklist_remove")
-async def blacklist_remove_start(callback: CallbackQuery):
+# Удаление — отдельное состояние FSM: раньше ввод ФИО ловил хендлер поиска с той же регуляркой
+@admin_callbacks.register("blacklist_remove")
+async def blacklist_remove_start(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
-    await callback.message.answer("Введите ФИО для удаления из ЧС:")
+    await state.set_state(BlacklistRemove.full_name)
+    await callback.message.answer("Введите ФИО для удаления из ЧС:", reply_markup=CANCEL_KB)
 
-@router.message(F.text.regexp(r'^[А-Яа-яЁё\s\-]+$'))
-async def blacklist_remove_process(message: Message):
-    if not is_admin(message.from_user.id):
+@admin_router.message(BlacklistRemove.full_name)
+async def blacklist_remove_process(message: Message, state: FSMContext):
+    text = (message.text or '').strip()
+    await state.clear()
+    if text.lower() in ["отмена", "-", ""]:
+        await message.answer("Действие отменено", reply_markup=ADMIN_KB)
         return
-    count = remove_from_blacklist(message.text.strip())
+    count = await remove_from_blacklist_async(text)
     if count > 0:
-        await message.answer(f"✅ Удалено {count} записей", reply_markup=create_admin_kb())
+        await blacklist_screen.load()
+        await message.answer(f"✅ Удалено {count} записей", reply_markup=ADMIN_KB)
+        logger.info(f"Админ {message.from_user.id} удалил из ЧС: {text} ({count})")
     else:
-        await message.answer("❌ Записи не найдены", reply_markup=create_admin_kb())
+        await message.answer("❌ Записи не найдены", reply_markup=ADMIN_KB)
+
+# Мероприятия: админ создаёт событие, рассылает приглашения подходящим официантам,
+# официанты отвечают кнопками в приглашении, места занимаются атомарно в базе
+async def render_events():
+    events = await get_upcoming_events_async(date.today().isoformat())
+    text = "📅 Ближайшие мероприятия:" if events else "📅 Ближайших мероприятий нет"
+    rows = [[(f"{format_date_for_user(event_date)} · {title} ({reserved}/{headcount})", f"event:{event_id}")]
+            for event_id, title, event_date, headcount, reserved in events]
+    rows.append([("➕ Новое мероприятие", "event_new")])
+    return text, inline_keyboard(*rows)
+
+async def render_event(event):
+    event_id, title, event_date, headcount, reserved = event
+    eligible = await count_eligible_staff_async(event_id, event_date)
+    counts = await get_invite_counts_async(event_id)
+    text = (
+        f"📅 {title}\n"
+        f"Дата: {format_date_for_user(event_date)}\n"
+        f"👥 Занято мест: {reserved} из {headcount}\n"
+        f"📨 Приглашено: {sum(counts.values())} (✅ {counts.get('accepted', 0)}, ❌ {counts.get('declined', 0)}, ⏳ {counts.get('invited', 0)})\n"
+        f"🆕 Подходят и ещё не приглашены: {eligible}"
+    )
+    rows = []
+    if eligible and reserved < headcount:
+        rows.append([(f"📨 Пригласить ({eligible})", f"event_invite:{event_id}")])
+    rows.append([("👥 Кто идёт", f"event_people:{event_id}"), ("🔄 Обновить", f"event:{event_id}")])
+    return text, inline_keyboard(*rows)
+
+@admin_menu.register(BTN_EVENTS)
+async def events_menu(message: Message, state: FSMContext):
+    text, kb = await render_events()
+    await message.answer(text, reply_markup=kb)
 
-@router.message(F.text.contains("Назад"))
-async def back_to_main(message: Message):
-    kb = create_main_kb(is_admin=is_admin(message.from_user.id))
-    await message.answer("🔙 Возврат в главное меню", reply_markup=kb)
+@admin_callbacks.register("event")
+async def event_card(callback: CallbackQuery, state: FSMContext):
+    event = await get_event_async(int(callback.data.split(':')[1]))
+    await callback.answer()
+    if event is None:
+        return
+    text, kb = await render_event(event)
+    if callback.message.text == text:
+        return
+    await callback.message.edit_text(text, reply_markup=kb)
 
-@router.message(F.text.contains("Помощь"))
-async def help_cmd(message: Message):
-    text = "ℹ️ Справка:\n\n👤 Для официантов:\n— /start для регистрации\n— Автоматические напоминания\n\n👑 Для админов:\n— Поиск, выгрузка, ЧС\n\n🔒 Данные защищены."
+@admin_callbacks.register("event_new")
+async def event_create_start(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    await state.set_state(EventCreate.title)
+    await callback.message.answer("Название мероприятия:", reply_markup=CANCEL_KB)
+
+@admin_router.message(EventCreate.title)
+async def event_create_title(message: Message, state: FSMContext):
+    text = (message.text or '').strip()
+    if text.lower() in ["отмена", ""]:
+        await state.clear()
+        await message.answer("Действие отменено", reply_markup=ADMIN_KB)
+        return
+    await state.update_data(title=text)
+    await state.set_state(EventCreate.event_date)
+    await message.answer("Дата мероприятия (ДД.ММ.ГГГГ):")
+
+@admin_router.message(EventCreate.event_date)
+async def event_create_date(message: Message, state: FSMContext):
+    text = (message.text or '').strip()
+    if text.lower() == "отмена":
+        await state.clear()
+        await message.answer("Действие отменено", reply_markup=ADMIN_KB)
+        return
+    if not validate_date(text):
+        await message.answer("❌ Неверный формат. Используйте ДД.ММ.ГГГГ")
+        return
+    event_date = format_date_for_db(text)
+    if event_date < date.today().isoformat():
+        await message.answer("❌ Дата уже прошла")
+        return
+    await state.update_data(event_date=event_date)
+    await state.set_state(EventCreate.headcount)
+    await message.answer("Сколько нужно официантов?")
+
+@admin_router.message(EventCreate.headcount)
+async def event_create_headcount(message: Message, state: FSMContext):
+    text = (message.text or '').strip()
+    if text.lower() == "отмена":
+        await state.clear()
+        await message.answer("Действие отменено", reply_markup=ADMIN_KB)
+        return
+    if not text.isdigit() or int(text) == 0:
+        await message.answer("❌ Введите число больше нуля")
+        return
+    data = await state.get_data()
+    await state.clear()
+    event_id = await create_event_async(data['title'], data['event_date'], int(text), message.from_user.id)
+    logger.info(f"Админ {message.from_user.id} создал мероприятие {event_id}: {data['title']}")
+    await message.answer("✅ Мероприятие создано", reply_markup=ADMIN_KB)
+    text, kb = await render_event(await get_event_async(event_id))
+    await message.answer(text, reply_markup=kb)
+
+async def invite_and_report(message: Message, event):
+    result = await send_invites(notifier, event)
+    if result is not None:
+        delivered, total = result
+        await message.answer(f"📨 «{event[1]}»: доставлено приглашений {delivered} из {total}")
+
+@admin_callbacks.register("event_invite")
+async def event_invite(callback: CallbackQuery, state: FSMContext):
+    event = await get_event_async(int(callback.data.split(':')[1]))
+    if event is None or event[2] < date.today().isoformat():
+        await callback.answer("Мероприятие уже прошло", show_alert=True)
+        return
+    await callback.answer("⏳ Рассылаем приглашения...")
+    # Рассылка идёт в фоне через общий отправитель: хендлер не ждёт тысячи сообщений
+    run_in_background(invite_and_report(callback.message, event))
+
+@admin_callbacks.register("event_people")
+async def event_people(callback: CallbackQuery, state: FSMContext):
+    event_id = int(callback.data.split(':')[1])
+    attendees = await get_event_attendees_async(event_id)
+    await callback.answer()
+    if not attendees:
+        await callback.message.answer("Пока никто не согласился")
+        return
+    lines = [f"{i}. {name}, {phone}" for i, (name, phone) in enumerate(attendees[:50], 1)]
+    if len(attendees) > 50:
+        lines.append(f"… и ещё {len(attendees) - 50}")
+    await callback.message.answer(f"👥 Идут ({len(attendees)}):\n\n" + "\n".join(lines))
+
+INVITE_REPLIES = {
+    'accepted': "✅ Вы записаны",
+    'declined': "❌ Вы отказались",
+    'unchanged': "Ответ уже учтён",
+    'full': "😔 Все места уже заняты",
+    'not_invited': "Приглашение не найдено",
+}
+
+@user_callbacks.register("invite")
+async def invite_answer(callback: CallbackQuery, state: FSMContext):
+    _, event_id, answer = callback.data.split(':')
+    event = await get_event_async(int(event_id))
+    if event is None or event[2] < date.today().isoformat():
+        await callback.answer("Мероприятие уже прошло", show_alert=True)
+        return
+    result, reserved = await answer_invite_async(event[0], callback.from_user.id, answer == 'yes')
+    await callback.answer(INVITE_REPLIES[result], show_alert=result == 'full')
+    if result not in ('accepted', 'declined'):
+        return
+    # Кнопки остаются: до мероприятия ответ можно изменить
+    await callback.message.edit_text(f"{invite_text(event)}\n\n{INVITE_REPLIES[result]}", reply_markup=invite_kb(event[0]))
+    if result == 'accepted' and reserved == event[3]:
+        run_in_background(notify_admins(f"✅ На «{event[1]}» ({format_date_for_user(event[2])}) набраны все {event[3]} официантов"))
+
+@admin_menu.register(BTN_BACK)
+@user_menu.register(BTN_BACK)
+async def back_to_main(message: Message, state: FSMContext):
+    await message.answer("🔙 Возврат в главное меню", reply_markup=main_kb(message.from_user.id))
+
+@admin_menu.register(BTN_HELP)
+@user_menu.register(BTN_HELP)
+async def help_cmd(message: Message, state: FSMContext):
+    text = "ℹ️ Справка:\n\n👤 Для официантов:\n— /start для регистрации\n— Автоматические напоминания\n\n👑 Для админов:\n— Поиск, выгрузка, ЧС, мероприятия\n— /backup — последний снимок базы\n\n🔒 Данные защищены."
     await message.answer(text)
 
+# Прочие inline-кнопки (админские — от не-админов): только убираем «часики» у кнопки
+@user_router.callback_query()
+async def callback_denied(callback: CallbackQuery):
+    await callback.answer()
+
 async def on_startup():
     logger.info("⏳ Инициализация базы данных...")
     try:
         init_db()
+        await blacklist_screen.load()
+        # Перенос данных в новый формат идёт пачками в фоне и не задерживает запуск
+        run_in_background(run_data_migrations_async())
         logger.info("✅ База данных инициализирована")
     except Exception as e:
         logger.error(f"❌ Ошибка инициализации БД: {e}")
         sys.exit(1) 
-    logger.info("✅ Бот запущен. Напоминания временно отключены.")
+    expiry_sweeper.start()
+    staff_archiver.start()
+    stats_snapshots.start()
+    if fsm_cleaner:
+        fsm_cleaner.start()
+    if backup_task:
+        backup_task.start()
+    if REMINDER_DAYS:
+        reminder_scheduler.start()
+        logger.info(f"✅ Бот запущен. Напоминания за {REMINDER_DAYS} дн. включены.")
+    else:
+        logger.info("✅ Бот запущен. Напоминания отключены (REMINDER_DAYS пуст).")
+
+async def on_shutdown():
+    await reminder_scheduler.stop()
+    await expiry_sweeper.stop()
+    await staff_archiver.stop()
+    await stats_snapshots.stop()
+    if fsm_cleaner:
+        await fsm_cleaner.stop()
+    if backup_task:
+        await backup_task.stop()
+    logger.info("⏳ Закрываем соединения с базой данных...")
+    await asyncio.to_thread(close_db)
+    await bot.session.close()
+
 async def main():
     dp.include_router(router)
     await on_startup()
-    for admin_id in ADMIN_IDS:
-        try:
-            await bot.send_message(admin_id, "✅ Бот запущен и готов к работе!")
-        except:
-            pass
-    logger.info("🚀 Бот запущен...")
-    await dp.start_polling(bot)
+    run_in_background(notify_admins("✅ Бот запущен и готов к работе!"))
+    logger.info(f"🚀 Бот запущен ({BOT_MODE}, воркеров: {BOT_WORKERS})...")
+    try:
+        if BOT_MODE == 'webhook':
+            # В кластере (BOT_WORKERS > 1) этот процесс только принимает апдейты, обработка — в воркерах
+            if BOT_WORKERS > 1:
+                await run_cluster(dp, bot, BOT_MODE)
+            else:
+                await run_webhook(dp, bot)
+        else:
+            metrics_runner = await start_metrics_server()
+            try:
+                await bot.delete_webhook()
+                if BOT_WORKERS > 1:
+                    await run_cluster(dp, bot, BOT_MODE)
+                else:
+                    await dp.start_polling(bot)
+            finally:
+                if metrics_runner:
+                    await metrics_runner.cleanup()
+    finally:
+        await on_shutdown()
 
 if __name__ == "__main__":
     try:
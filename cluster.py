@@ -0,0 +1,215 @@
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+
+from aiogram.types import Update
+
+from sender import FloodControlMiddleware
+from tasks import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+# Сколько процессов-обработчиков запускать; 1 — обычный режим без кластера
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', '1'))
+# Сколько апдейтов один воркер обрабатывает одновременно (апдейты одного чата — всегда по очереди)
+WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', '32'))
+# Сколько секунд ждать запуска воркеров и завершения их очередей при остановке
+WORKER_START_TIMEOUT = float(os.getenv('WORKER_START_TIMEOUT', '60'))
+WORKER_STOP_TIMEOUT = float(os.getenv('WORKER_STOP_TIMEOUT', '30'))
+# Как часто воркер сверяет версию чёрного списка с базой и фронт проверяет, живы ли воркеры
+CLUSTER_SYNC_INTERVAL = int(os.getenv('CLUSTER_SYNC_INTERVAL', '5'))
+# Long polling во фронт-процессе
+POLLING_TIMEOUT = int(os.getenv('POLLING_TIMEOUT', '30'))
+
+def shard_key(update):
+    # Ключ шардирования — id чата (или пользователя): все апдейты одного
+    # официанта попадают в один воркер, и его FSM-сессия не «разъезжается» между процессами
+    event = update.event
+    chat = getattr(event, 'chat', None) or getattr(getattr(event, 'message', None), 'chat', None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, 'from_user', None)
+    return user.id if user is not None else update.update_id
+
+class ShardedFeeder:
+    # Фронт кластера: вместо dp.feed_update раскладывает апдейты по очередям воркеров.
+    # Подходит везде, где ожидается диспетчер (UpdateQueue вебхука, цикл polling)
+    def __init__(self, workers=BOT_WORKERS, session_factory=None):
+        self.workers_count = workers
+        self.session_factory = session_factory
+        self.ctx = multiprocessing.get_context('spawn')
+        self.queues = [self.ctx.Queue() for _ in range(workers)]
+        self.ready = self.ctx.Queue()
+        self.processes = [None] * workers
+        self.supervisor = PeriodicTask('cluster-supervisor', CLUSTER_SYNC_INTERVAL, self.restart_dead)
+
+    def _spawn(self, index):
+        process = self.ctx.Process(
+            target=worker_main, args=(index, self.queues[index], self.ready, self.session_factory),
+            name=f'bot-worker-{index}',
+        )
+        process.start()
+        self.processes[index] = process
+
+    async def start(self):
+        for index in range(self.workers_count):
+            self._spawn(index)
+        for _ in range(self.workers_count):
+            try:
+                await asyncio.to_thread(self.ready.get, timeout=WORKER_START_TIMEOUT)
+            except queue.Empty:
+                raise RuntimeError("Воркеры кластера не запустились вовремя")
+        self.supervisor.start()
+        logger.info(f"✅ Запущено воркеров: {self.workers_count}")
+
+    async def restart_dead(self):
+        for index, process in enumerate(self.processes):
+            if not process.is_alive():
+                logger.error(f"❌ Воркер {index} завершился (код {process.exitcode}), перезапускаем")
+                self._spawn(index)
+
+    async def feed_update(self, bot, update):
+        index = shard_key(update) % self.workers_count
+        self.queues[index].put(update.model_dump_json(by_alias=True, exclude_unset=True))
+
+    async def stop(self, timeout=WORKER_STOP_TIMEOUT):
+        # None в очереди — сигнал воркеру доработать принятое и завершиться
+        await self.supervisor.stop()
+        for q in self.queues:
+            q.put(None)
+        for index, process in enumerate(self.processes):
+            await asyncio.to_thread(process.join, timeout)
+            if process.is_alive():
+                logger.warning(f"⚠️ Воркер {index} не завершился за {timeout} с, останавливаем")
+                process.terminate()
+
+def _load_app():
+    # Модуль бота с router/dp. Если процесс запущен как `python bot.py`, spawn уже выполнил
+    # его под именем __main__ — берём его, чтобы не создавать второй Bot и второе хранилище
+    main = sys.modules.get('__main__')
+    if hasattr(main, 'router') and hasattr(main, 'dp'):
+        return main
+    return importlib.import_module('bot')
+
+def worker_main(index, updates, ready, session_factory=None):
+    try:
+        asyncio.run(_run_worker(index, updates, ready, session_factory))
+    except KeyboardInterrupt:
+        pass
+
+async def _run_worker(index, updates, ready, session_factory):
+    # Ctrl+C получает вся группа процессов — воркер останавливается только по сигналу от фронта
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    app = _load_app()
+    from database import close_db, staff_cache
+    from metrics import METRICS_PORT, start_metrics_server
+
+    bot = app.bot
+    if session_factory is not None:
+        bot.session = session_factory()
+        bot.session.middleware(FloodControlMiddleware(app.notifier))
+    app.dp.include_router(app.router)
+    await app.blacklist_screen.load()
+
+    async def sync_shared_state():
+        # ЧС и профили могли измениться в другом процессе (например, админ добавил запись в ЧС)
+        if await app.blacklist_screen.refresh():
+            staff_cache.clear()
+
+    sync = PeriodicTask(f'cluster-sync-{index}', CLUSTER_SYNC_INTERVAL, sync_shared_state)
+    sync.start()
+    # Метрики каждого воркера — на своём порту: METRICS_PORT + 1 + номер воркера
+    metrics_runner = await start_metrics_server(METRICS_PORT + 1 + index) if METRICS_PORT else None
+
+    slots = asyncio.Semaphore(WORKER_CONCURRENCY)
+    chat_locks = {}
+    tasks = set()
+
+    async def process(update):
+        key = shard_key(update)
+        lock, waiting = chat_locks.get(key, (asyncio.Lock(), 0))
+        chat_locks[key] = (lock, waiting + 1)
+        try:
+            # asyncio.Lock честный (FIFO): апдейты одного чата выполняются в порядке поступления
+            async with lock:
+                await app.dp.feed_update(bot, update)
+        except Exception:
+            logger.exception(f"❌ Воркер {index}: ошибка обработки апдейта {update.update_id}")
+        finally:
+            lock, waiting = chat_locks[key]
+            if waiting == 1:
+                del chat_locks[key]
+            else:
+                chat_locks[key] = (lock, waiting - 1)
+            slots.release()
+
+    ready.put(index)
+    logger.info(f"✅ Воркер {index} (pid {os.getpid()}) готов")
+    try:
+        while True:
+            await slots.acquire()
+            raw = await asyncio.to_thread(updates.get)
+            if raw is None:
+                break
+            update = Update.model_validate_json(raw, context={'bot': bot})
+            task = asyncio.create_task(process(update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await sync.stop()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await app.storage.close()
+        await asyncio.to_thread(close_db)
+        await bot.session.close()
+
+async def poll_updates(bot, feeder, allowed_updates):
+    # Long polling во фронт-процессе: апдейты не обрабатываются здесь, а уходят воркерам
+    offset = None
+    delay = 1
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=POLLING_TIMEOUT, allowed_updates=allowed_updates)
+        except Exception as e:
+            # Как и start_polling aiogram: сеть, 5xx, конфликт сессий — повторяем с паузой, а не роняем кластер
+            logger.warning(f"⚠️ Ошибка getUpdates: {e!r}, повтор через {delay} с")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+            continue
+        delay = 1
+        for update in updates:
+            offset = update.update_id + 1
+            await feeder.feed_update(bot, update)
+
+async def run_cluster(dp, bot, mode, workers=BOT_WORKERS):
+    # Фронт-процесс: принимает апдейты (polling или webhook) и шардирует их по воркерам.
+    # Фоновые задачи (напоминания, sweep, снимки статистики) работают только во фронте
+    from webhook import run_webhook
+
+    feeder = ShardedFeeder(workers)
+    await feeder.start()
+    try:
+        if mode == 'webhook':
+            await run_webhook(dp, bot, feeder)
+            return
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        polling = asyncio.create_task(poll_updates(bot, feeder, dp.resolve_used_update_types()))
+        stopping = asyncio.create_task(stop.wait())
+        await asyncio.wait([polling, stopping], return_when=asyncio.FIRST_COMPLETED)
+        stopping.cancel()
+        if polling.done():
+            polling.result()
+        polling.cancel()
+        await asyncio.gather(polling, return_exceptions=True)
+    finally:
+        logger.info("⏳ Останавливаем воркеры...")
+        await feeder.stop()
@@ -1,12 +1,256 @@
 import sqlite3
 import os
-import tempfile
-# Используем /app/waiters.db — Railway гарантирует, что /app доступен при наличии volume
-DB_PATH = os.path.join(tempfile.gettempdir(), 'waiters.db')
+import logging
+import re
+import queue
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, timedelta
 
+from backup import create_snapshot, list_snapshots, restore_latest_snapshot
+from cache import LRUCache, MISSING
+from metrics import Gauge, timed
+from migrations import DATA_MIGRATIONS, migrate
+from utils import blacklist_keys, format_phone_for_db, name_key, normalize_birth_date, normalize_name, normalize_phone
+
+logger = logging.getLogger(__name__)
+
+# База и снимки лежат на постоянном томе: DATA_DIR, иначе точка монтирования volume Railway, иначе /app.
+# Через DB_PATH все процессы кластера (см. cluster.py) указывают на одну базу на общем томе
+DATA_DIR = os.getenv('DATA_DIR') or os.getenv('RAILWAY_VOLUME_MOUNT_PATH') or '/app'
+DB_PATH = os.getenv('DB_PATH', os.path.join(DATA_DIR, 'waiters.db'))
+# Сжатые снимки базы (см. backup.py); при старте без базы она восстанавливается из последнего
+BACKUP_DIR = os.getenv('BACKUP_DIR', os.path.join(DATA_DIR, 'backups'))
+BACKUP_RESTORE = os.getenv('BACKUP_RESTORE', '1') == '1'
+# Сколько соединений держим открытыми одновременно (и столько же потоков для async-запросов)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '4'))
+# Сколько записей писатель максимум объединяет в одну транзакцию
+DB_WRITE_BATCH = int(os.getenv('DB_WRITE_BATCH', '200'))
+# Сколько записей переводится в «просрочена» одной транзакцией
+SWEEP_BATCH = int(os.getenv('SWEEP_BATCH', '500'))
+# Через сколько дней после истечения медкнижки официант уходит в архив и сколько строк переносит одна транзакция
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '365'))
+ARCHIVE_BATCH = int(os.getenv('ARCHIVE_BATCH', '500'))
+# Сколько дней официант, которого админ вернул из архива, не уходит туда снова: время обновить медкнижку
+ARCHIVE_REACTIVATED_GRACE_DAYS = int(os.getenv('ARCHIVE_REACTIVATED_GRACE_DAYS', '30'))
+# Сколько строк переписывает одна транзакция фоновой миграции данных
+MIGRATION_BATCH = int(os.getenv('MIGRATION_BATCH', '1000'))
+# Кэш профилей по telegram_id: горячие хендлеры (/start, «Мои данные») не ходят в базу
+STAFF_CACHE_SIZE = int(os.getenv('STAFF_CACHE_SIZE', '10000'))
+STAFF_CACHE_TTL = int(os.getenv('STAFF_CACHE_TTL', '300'))
+# Сколько секунд держим готовую сводку статистики (окна «истекает через N дней» зависят от даты)
+STATS_CACHE_TTL = int(os.getenv('STATS_CACHE_TTL', '60'))
+staff_cache = LRUCache(STAFF_CACHE_SIZE, STAFF_CACHE_TTL)
+Gauge('staff_cache', 'Кэш профилей: size, hits, misses', lambda: {(k,): v for k, v in staff_cache.stats().items()}, ('stat',))
+
+# Профили хранения: набор PRAGMA, которые init_db и каждое соединение применяют к базе.
+# 'wal' — для пиковых регистраций, 'safe' — классический rollback-журнал
+STORAGE_PROFILES = {
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64000,
+        'busy_timeout': 30000,
+    },
+    'safe': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'mmap_size': 0,
+        'cache_size': -2000,
+        'busy_timeout': 30000,
+    },
+}
+DB_PROFILE = os.getenv('DB_PROFILE', 'wal')
+
+def get_storage_profile():
+    # Любую настройку профиля можно переопределить переменной окружения, например DB_SYNCHRONOUS=FULL
+    profile = dict(STORAGE_PROFILES[DB_PROFILE])
+    for key in profile:
+        value = os.getenv(f'DB_{key.upper()}')
+        if value:
+            profile[key] = value
+    return profile
+
+def apply_pragmas(conn, profile=None):
+    profile = profile or get_storage_profile()
+    for key in ('busy_timeout', 'synchronous', 'cache_size', 'mmap_size'):
+        conn.execute(f'PRAGMA {key} = {profile[key]}')
+
+# Пул долгоживущих соединений: берём свободное, после запроса возвращаем обратно
+_pool = queue.LifoQueue()
+_pool_slots = threading.BoundedSemaphore(DB_POOL_SIZE)
+_executor = None
+
+def _connect():
+    conn = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False)
+    apply_pragmas(conn)
+    return conn
+
+@contextmanager
+def get_connection():
+    _pool_slots.acquire()
+    try:
+        try:
+            conn = _pool.get_nowait()
+        except queue.Empty:
+            conn = _connect()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            _pool.put(conn)
+    finally:
+        _pool_slots.release()
+
+class WriterConnection(sqlite3.Connection):
+    # Соединение писателя: функции записи кладут в after_commit действия,
+    # которые нужно выполнить только после успешного COMMIT (например, сброс кэша)
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.after_commit = []
+
+class WriteQueue:
+    # Единственный поток-писатель: забирает всё, что накопилось в очереди, и коммитит
+    # одной транзакцией (group commit). Каждая запись выполняется в своём SAVEPOINT,
+    # поэтому ошибка одной не откатывает остальные.
+    def __init__(self, path, batch_size=DB_WRITE_BATCH):
+        self.path = path
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        # func(conn, *args, **kwargs) вызывается в потоке писателя, результат — в Future
+        future = Future()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+            self._queue.put((func, args, kwargs, future))
+        return future
+
+    def execute(self, func, *args, **kwargs):
+        return self.submit(func, *args, **kwargs).result()
+
+    async def execute_async(self, func, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    def close(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, factory=WriterConnection)
+        apply_pragmas(conn)
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(conn, batch)
+        conn.close()
+
+    def _commit(self, conn, batch):
+        results = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for func, args, kwargs, future in batch:
+                conn.execute('SAVEPOINT write_item')
+                callbacks = len(conn.after_commit)
+                try:
+                    results.append((future, func(conn, *args, **kwargs), None))
+                    conn.execute('RELEASE write_item')
+                except Exception as e:
+                    conn.execute('ROLLBACK TO write_item')
+                    conn.execute('RELEASE write_item')
+                    del conn.after_commit[callbacks:]
+                    results.append((future, None, e))
+            conn.execute('COMMIT')
+        except Exception as e:
+            conn.after_commit.clear()
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            for *_, future in batch:
+                future.set_exception(e)
+            return
+        for callback in conn.after_commit:
+            try:
+                callback()
+            except Exception:
+                logger.exception("❌ Ошибка в after_commit")
+        conn.after_commit.clear()
+        # Результаты отдаём только после COMMIT — запись уже на диске
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+_writer = None
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        _writer = WriteQueue(DB_PATH)
+    return _writer
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix='db')
+    return _executor
+
+async def run_db(func, *args, **kwargs):
+    # Выполняем блокирующий запрос в потоке пула, не останавливая event loop
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(func, *args, **kwargs))
+
+def close_db():
+    global _executor, _writer
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    while True:
+        try:
+            conn = _pool.get_nowait()
+        except queue.Empty:
+            break
+        conn.close()
+
+@timed
 def init_db():
     # Создаём директорию и файл ПЕРЕД подключением
-    os.makedirs('/app', exist_ok=True)
+    os.makedirs(os.path.dirname(DB_PATH) or '.', exist_ok=True)
+    if not os.path.exists(DB_PATH) and BACKUP_RESTORE:
+        restored = restore_latest_snapshot(DB_PATH, BACKUP_DIR)
+        if restored:
+            print(f"♻️ База восстановлена из снимка: {restored}")
     if not os.path.exists(DB_PATH):
         try:
             with open(DB_PATH, 'w') as f:
@@ -16,126 +260,699 @@ def init_db():
             print(f"⚠️ Не удалось создать файл: {e}")
             raise
 
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    # ... остальной код init_db() без изменений ...
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS staff (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            telegram_id INTEGER UNIQUE NOT NULL,
-            full_name TEXT NOT NULL,
-            birth_date TEXT NOT NULL,
-            phone TEXT NOT NULL,
-            medbook_status TEXT CHECK(medbook_status IN ('действует', 'просрочена', 'оформляется')) DEFAULT 'действует',
-            medbook_expiry DATE NOT NULL,
-            consent_given BOOLEAN DEFAULT 0,
-            registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS blacklist (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            full_name TEXT NOT NULL,
-            phone TEXT,
-            birth_date TEXT,
-            reason TEXT NOT NULL,
-            blacklisted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            added_by INTEGER NOT NULL
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        conn.execute(f"PRAGMA journal_mode = {get_storage_profile()['journal_mode']}")
+        # Схема создаётся и обновляется версионными миграциями (см. migrations.py)
+        migrate(conn)
 
-def add_staff(telegram_id, full_name, birth_date, phone, medbook_expiry):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO staff 
-        (telegram_id, full_name, birth_date, phone, medbook_status, medbook_expiry, consent_given, updated_at)
-        VALUES (?, ?, ?, ?, 'действует', ?, 1, CURRENT_TIMESTAMP)
-    ''', (telegram_id, full_name, birth_date, phone, medbook_expiry))
-    conn.commit()
-    conn.close()    
+def build_search_query(text):
+    # Каждое слово запроса ищем как префикс: «иван петр» → "иван"* AND "петр"*
+    if re.fullmatch(r'[\d\s+()\-]+', text):
+        # Телефон в индексе хранится одной цифровой строкой; «-» или «()» без цифр — не запрос
+        phone = normalize_phone(text)
+        tokens = [phone] if phone else []
+    else:
+        tokens = re.findall(r'\w+', normalize_name(text))
+    return ' AND '.join(f'"{token}"*' for token in tokens)
+
+# Запись идёт через очередь писателя: _xxx(conn, ...) выполняется внутри общей транзакции
+def medbook_status_for(medbook_expiry):
+    # Статус сразу соответствует дате: sweep обрабатывает только то, что истекло после записи
+    return 'просрочена' if medbook_expiry < date.today().isoformat() else 'действует'
+
+# UPSERT вместо INSERT OR REPLACE: id записи сохраняется, и триггеры поискового индекса срабатывают.
+# Согласие на обработку ПД, данное в боте, повторный импорт без согласия не отменяет
+STAFF_UPSERT_SQL = '''
+    INSERT INTO staff 
+    (telegram_id, full_name, birth_date, phone, medbook_status, medbook_expiry, consent_given, name_key, phone_key, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(telegram_id) DO UPDATE SET
+        full_name = excluded.full_name, birth_date = excluded.birth_date, phone = excluded.phone,
+        name_key = excluded.name_key, phone_key = excluded.phone_key,
+        medbook_status = excluded.medbook_status, medbook_expiry = excluded.medbook_expiry,
+        consent_given = MAX(consent_given, excluded.consent_given), updated_at = excluded.updated_at
+'''
+
+@timed
+def _add_staff(conn, telegram_id, full_name, birth_date, phone, medbook_expiry):
+    # Регистрация в боте проходит только после согласия на обработку ПД
+    registered = conn.execute('SELECT 1 FROM staff WHERE telegram_id = ?', (telegram_id,)).fetchone() is None
+    conn.execute(STAFF_UPSERT_SQL, (
+        telegram_id, full_name, birth_date, format_phone_for_db(phone), medbook_status_for(medbook_expiry), medbook_expiry, 1,
+        name_key(full_name), normalize_phone(phone)
+    ))
+    # Повторная регистрация из архива: человек либо в рабочей таблице, либо в архиве
+    conn.execute('DELETE FROM staff_archive WHERE telegram_id = ?', (telegram_id,))
+    if registered:
+        # Статистика «Регистрации за неделю»: импорт и возврат из архива сюда не попадают
+        conn.execute('''
+            INSERT INTO registrations_daily (day, count) VALUES (date('now', 'localtime'), 1)
+            ON CONFLICT(day) DO UPDATE SET count = count + 1
+        ''')
+    conn.after_commit.append(functools.partial(staff_cache.invalidate, telegram_id))
     return True
 
-def update_medbook(telegram_id, medbook_expiry):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
+@timed
+def _import_staff(conn, rows):
+    # Пакетный импорт: rows — [(telegram_id, full_name, birth_date, phone, medbook_expiry, consent)], даты в ISO.
+    # consent — дано ли согласие на обработку ПД; без него напоминания и приглашения не отправляются
+    conn.executemany(STAFF_UPSERT_SQL, [
+        (telegram_id, full_name, birth_date, format_phone_for_db(phone), medbook_status_for(medbook_expiry), medbook_expiry, consent,
+         name_key(full_name), normalize_phone(phone))
+        for telegram_id, full_name, birth_date, phone, medbook_expiry, consent in rows
+    ])
+    conn.executemany('DELETE FROM staff_archive WHERE telegram_id = ?', [(row[0],) for row in rows])
+    for row in rows:
+        conn.after_commit.append(functools.partial(staff_cache.invalidate, row[0]))
+    return len(rows)
+
+def import_staff(rows):
+    return get_writer().execute(_import_staff, rows)
+
+def add_staff(telegram_id, full_name, birth_date, phone, medbook_expiry):
+    return get_writer().execute(_add_staff, telegram_id, full_name, birth_date, phone, medbook_expiry)
+
+@timed
+def _update_medbook(conn, telegram_id, medbook_expiry):
+    conn.execute('''
         UPDATE staff 
-        SET medbook_expiry = ?, updated_at = CURRENT_TIMESTAMP 
+        SET medbook_expiry = ?, medbook_status = ?, updated_at = CURRENT_TIMESTAMP 
         WHERE telegram_id = ?
-    ''', (medbook_expiry, telegram_id))
-    conn.commit()
-    conn.close()
-
-def get_staff_by_surname(surname):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT full_name, birth_date, phone, medbook_status, medbook_expiry FROM staff WHERE full_name LIKE ? ORDER BY full_name', (f'%{surname}%',))
-    result = cursor.fetchall()
-    conn.close()
-    return result
+    ''', (medbook_expiry, medbook_status_for(medbook_expiry), telegram_id))
+    conn.after_commit.append(functools.partial(staff_cache.invalidate, telegram_id))
+
+def update_medbook(telegram_id, medbook_expiry):
+    return get_writer().execute(_update_medbook, telegram_id, medbook_expiry)
+
+@timed
+def search_staff(text, limit=10, offset=0):
+    # Возвращает (всего совпадений, страница результатов), лучшие совпадения — первыми
+    query = build_search_query(text)
+    if not query:
+        return 0, []
+    with get_connection() as conn:
+        total = conn.execute('SELECT COUNT(*) FROM staff_search WHERE staff_search MATCH ?', (query,)).fetchone()[0]
+        if not total:
+            return 0, []
+        cursor = conn.execute('''
+            SELECT s.full_name, s.birth_date, s.phone, s.medbook_status, s.medbook_expiry
+            FROM staff_search JOIN staff s ON s.id = staff_search.rowid
+            WHERE staff_search MATCH ?
+            ORDER BY staff_search.rank, s.full_name
+            LIMIT ? OFFSET ?
+        ''', (query, limit, offset))
+        return total, cursor.fetchall()
+
+@timed
+def _load_staff(telegram_id):
+    with get_connection() as conn:
+        cursor = conn.execute('SELECT full_name, birth_date, phone, medbook_status, medbook_expiry, consent_given FROM staff WHERE telegram_id = ?', (telegram_id,))
+        row = cursor.fetchone()
+    # Кэшируем и отсутствие записи: /start незарегистрированного не должен каждый раз ходить в базу
+    staff_cache.set(telegram_id, row)
+    return row
+
+def get_staff_by_id(telegram_id):
+    row = staff_cache.get(telegram_id)
+    if row is MISSING:
+        row = _load_staff(telegram_id)
+    return row
+
+@timed
+def iter_staff(status=None, expiry_from=None, expiry_to=None, chunk_size=500):
+    # Потоковое чтение для выгрузки: строки забираются пачками по chunk_size,
+    # весь список в память не загружается
+    where, params = [], []
+    if status:
+        where.append('medbook_status = ?')
+        params.append(status)
+    if expiry_from:
+        where.append('medbook_expiry >= ?')
+        params.append(expiry_from)
+    if expiry_to:
+        where.append('medbook_expiry <= ?')
+        params.append(expiry_to)
+    sql = 'SELECT full_name, birth_date, phone, medbook_status, medbook_expiry FROM staff'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY full_name'
+    with get_connection() as conn:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield from rows
 
 def get_all_staff():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT full_name, birth_date, phone, medbook_status, medbook_expiry FROM staff ORDER BY full_name')
-    result = cursor.fetchall()
-    conn.close()
-    return result
+    return list(iter_staff())
 
+@timed
 def get_expiring_medbooks(days_ahead):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT telegram_id, full_name, medbook_expiry FROM staff WHERE medbook_status = "действует" AND date(medbook_expiry) BETWEEN date("now") AND date("now", ? || " days") AND consent_given = 1 ORDER BY medbook_expiry', (days_ahead,))
-    result = cursor.fetchall()
-    conn.close()
-    return result
+    # Границы считаем в Python: сравнение «голого» medbook_expiry использует индекс (status, expiry)
+    today = date.today()
+    with get_connection() as conn:
+        cursor = conn.execute(
+            "SELECT telegram_id, full_name, medbook_expiry FROM staff WHERE medbook_status = 'действует' AND medbook_expiry BETWEEN ? AND ? AND consent_given = 1 ORDER BY medbook_expiry",
+            (today.isoformat(), (today + timedelta(days=days_ahead)).isoformat())
+        )
+        return cursor.fetchall()
+
+@timed
+def get_meta(key, default=None):
+    with get_connection() as conn:
+        row = conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+@timed
+def _set_meta(conn, key, value):
+    conn.execute('INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value', (key, value))
+
+@timed
+def _data_migration_batch(conn, func, key, after_id, limit):
+    last_id = func(conn, after_id, limit)
+    _set_meta(conn, key, 'done' if last_id is None else str(last_id))
+    return last_id
+
+async def run_data_migrations_async(batch_size=MIGRATION_BATCH):
+    # Фоновые миграции данных (см. migrations.DATA_MIGRATIONS): пачки идут через очередь
+    # писателя вперемешку с обычными записями бота
+    for name, func in DATA_MIGRATIONS:
+        key = f'data_migration:{name}'
+        progress = await run_db(get_meta, key)
+        if progress == 'done':
+            continue
+        after_id = int(progress or 0)
+        logger.info(f"⏳ Миграция данных {name}: продолжаем с id {after_id}")
+        while after_id is not None:
+            after_id = await get_writer().execute_async(_data_migration_batch, func, key, after_id, batch_size)
+        logger.info(f"✅ Миграция данных {name} завершена")
+
+def _invalidate_staff_rows(conn, rows):
+    for (telegram_id,) in rows:
+        conn.after_commit.append(functools.partial(staff_cache.invalidate, telegram_id))
+    return len(rows)
+
+@timed
+def _sweep_expired_batch(conn, since, today, batch_size):
+    cursor = conn.execute('''
+        UPDATE staff SET medbook_status = 'просрочена', updated_at = CURRENT_TIMESTAMP
+        WHERE id IN (
+            SELECT id FROM staff
+            WHERE medbook_status = 'действует' AND medbook_expiry >= ? AND medbook_expiry < ?
+            LIMIT ?
+        )
+        RETURNING telegram_id
+    ''', (since, today, batch_size))
+    return _invalidate_staff_rows(conn, cursor.fetchall())
+
+@timed
+def sweep_expired_medbooks(today=None, batch_size=SWEEP_BATCH):
+    # Переводит истёкшие медкнижки в «просрочена» небольшими транзакциями через очередь писателя.
+    # Водяной знак — дата предыдущего sweep: всё, что истекло раньше, уже обработано,
+    # поэтому каждый запуск проходит по индексу только диапазон [водяной знак, сегодня)
+    today = (today or date.today()).isoformat()
+    since = get_meta('medbook_sweep_watermark', '')
+    writer = get_writer()
+    total = 0
+    while True:
+        swept = writer.execute(_sweep_expired_batch, since, today, batch_size)
+        total += swept
+        if swept < batch_size:
+            break
+    writer.execute(_set_meta, 'medbook_sweep_watermark', today)
+    return total
+
+# Архив: в staff остаются только рабочие строки, и все выборки по staff не платят за историю
+STAFF_COLUMNS = 'id, telegram_id, full_name, birth_date, phone, medbook_status, medbook_expiry, consent_given, registered_at, updated_at'
+ARCHIVE_REASON_EXPIRED = 'медкнижка просрочена'
+ARCHIVE_REASON_BLACKLIST = 'чёрный список'
+
+def _move_to_archive(conn, where, params, reason):
+    # Переносит строки staff, подходящие под условие, в архив одной транзакцией. Возвращает их число
+    ids = [row[0] for row in conn.execute(f'SELECT id FROM staff WHERE {where}', params)]
+    if not ids:
+        return 0
+    placeholders = ', '.join('?' for _ in ids)
+    conn.execute(f'DELETE FROM staff_archive WHERE telegram_id IN (SELECT telegram_id FROM staff WHERE id IN ({placeholders}))', ids)
+    conn.execute(f'INSERT INTO staff_archive ({STAFF_COLUMNS}, archive_reason) SELECT {STAFF_COLUMNS}, ? FROM staff WHERE id IN ({placeholders})', (reason, *ids))
+    cursor = conn.execute(f'DELETE FROM staff WHERE id IN ({placeholders}) RETURNING telegram_id', ids)
+    return _invalidate_staff_rows(conn, cursor.fetchall())
+
+@timed
+def _archive_expired_batch(conn, cutoff, grace_cutoff, batch_size):
+    # Выборка идёт по индексу (status, expiry); недавно возвращённых из архива пропускаем
+    return _move_to_archive(
+        conn, '''id IN (SELECT id FROM staff WHERE medbook_status = 'просрочена' AND medbook_expiry < ?
+            AND (reactivated_at IS NULL OR reactivated_at < ?) LIMIT ?)''',
+        (cutoff, grace_cutoff, batch_size), ARCHIVE_REASON_EXPIRED
+    )
+
+@timed
+def archive_expired_staff(today=None, after_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH, grace_days=ARCHIVE_REACTIVATED_GRACE_DAYS):
+    # Переносит в архив тех, у кого медкнижка просрочена дольше after_days, небольшими транзакциями
+    # через очередь писателя: регистрации и ответы хендлеров не ждут весь перенос
+    today = today or date.today()
+    cutoff = (today - timedelta(days=after_days)).isoformat()
+    grace_cutoff = (today - timedelta(days=grace_days)).isoformat()
+    writer = get_writer()
+    total = 0
+    while True:
+        moved = writer.execute(_archive_expired_batch, cutoff, grace_cutoff, batch_size)
+        total += moved
+        if moved < batch_size:
+            return total
+
+@timed
+def search_archive(text, limit=10):
+    # Явный поиск админа по архиву: (всего совпадений, [(telegram_id, ФИО, ДР, телефон, медкнижка до, в архиве с, причина)])
+    query = build_search_query(text)
+    if not query:
+        return 0, []
+    with get_connection() as conn:
+        total = conn.execute('SELECT COUNT(*) FROM staff_archive_search WHERE staff_archive_search MATCH ?', (query,)).fetchone()[0]
+        if not total:
+            return 0, []
+        cursor = conn.execute('''
+            SELECT a.telegram_id, a.full_name, a.birth_date, a.phone, a.medbook_expiry, a.archived_at, a.archive_reason
+            FROM staff_archive_search JOIN staff_archive a ON a.id = staff_archive_search.rowid
+            WHERE staff_archive_search MATCH ?
+            ORDER BY staff_archive_search.rank, a.full_name
+            LIMIT ?
+        ''', (query, limit))
+        return total, cursor.fetchall()
+
+@timed
+def get_archived_staff(telegram_id):
+    with get_connection() as conn:
+        return conn.execute(
+            'SELECT telegram_id, full_name, birth_date, phone, medbook_expiry, archived_at, archive_reason FROM staff_archive WHERE telegram_id = ?',
+            (telegram_id,)
+        ).fetchone()
+
+@timed
+def _reactivate_staff(conn, telegram_id):
+    # Возвращает официанта из архива в staff с тем же id; статус медкнижки пересчитывается по дате.
+    # Возвращает ФИО или None, если в архиве его нет
+    row = conn.execute(f'SELECT {STAFF_COLUMNS} FROM staff_archive WHERE telegram_id = ?', (telegram_id,)).fetchone()
+    if row is None:
+        return None
+    values = list(row)
+    values[5] = medbook_status_for(values[6])
+    # Ключи для сверки с ЧС архив не хранит — считаем заново. Дата возврата даёт льготный срок:
+    # с той же просроченной медкнижкой ближайший перенос в архив его не заберёт
+    values += [name_key(values[2]), normalize_phone(values[4]), date.today().isoformat()]
+    conn.execute(f'INSERT INTO staff ({STAFF_COLUMNS}, name_key, phone_key, reactivated_at) VALUES ({", ".join("?" for _ in values)})', values)
+    conn.execute('DELETE FROM staff_archive WHERE telegram_id = ?', (telegram_id,))
+    conn.after_commit.append(functools.partial(staff_cache.invalidate, telegram_id))
+    return values[2]
+
+@timed
+def get_due_reminders(days_list, today):
+    # Одним запросом по всем срокам из REMINDER_DAYS: кому пора напомнить и за сколько дней.
+    # Если бот пропустил момент (был выключен), берётся наименьший подходящий срок.
+    # Возвращает (telegram_id, full_name, medbook_expiry, days_before)
+    days_list = sorted(set(days_list))
+    if not days_list:
+        return []
+    offsets = ', '.join('(?)' for _ in days_list)
+    last_day = (today + timedelta(days=days_list[-1])).isoformat()
+    with get_connection() as conn:
+        cursor = conn.execute(f'''
+            WITH offsets (days_before) AS (VALUES {offsets})
+            SELECT s.telegram_id, s.full_name, s.medbook_expiry, MIN(o.days_before)
+            FROM staff s
+            JOIN offsets o ON s.medbook_expiry <= date(?, '+' || o.days_before || ' days')
+            WHERE s.medbook_status = 'действует' AND s.consent_given = 1
+              AND s.medbook_expiry BETWEEN ? AND ?
+              AND NOT EXISTS (
+                  SELECT 1 FROM reminders_sent r
+                  WHERE r.telegram_id = s.telegram_id AND r.medbook_expiry = s.medbook_expiry
+                    AND r.days_before = o.days_before
+              )
+            GROUP BY s.telegram_id
+            ORDER BY s.medbook_expiry
+        ''', (*days_list, today.isoformat(), today.isoformat(), last_day))
+        return cursor.fetchall()
+
+@timed
+def _mark_reminder_sent(conn, telegram_id, medbook_expiry, days_list):
+    # Отмечаем все сроки, которые это напоминание покрыло (например, и 14, и 3 дня)
+    conn.executemany(
+        'INSERT OR IGNORE INTO reminders_sent (telegram_id, medbook_expiry, days_before) VALUES (?, ?, ?)',
+        [(telegram_id, medbook_expiry, days) for days in days_list]
+    )
+
+@timed
+def _add_to_blacklist(conn, full_name, phone, birth_date, reason, admin_id):
+    # Возвращает id новой записи. Дата рождения хранится в ISO, как в staff
+    birth_date = normalize_birth_date(birth_date)
+    cursor = conn.execute(
+        'INSERT INTO blacklist (full_name, phone, birth_date, reason, added_by, name_key, phone_key, birth_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        (full_name, phone, birth_date, reason, admin_id, *blacklist_keys(full_name, phone, birth_date))
+    )
+    blacklist_id = cursor.lastrowid
+    _move_to_archive(conn, 'full_name = ?', (full_name,), ARCHIVE_REASON_BLACKLIST)
+    return blacklist_id
+
+@timed
+def _import_blacklist(conn, rows, admin_id):
+    # Пакетный импорт ЧС: rows — [(full_name, phone, birth_date, reason)]; как и add_to_blacklist,
+    # переносит людей с тем же ФИО из staff в архив
+    conn.executemany(
+        'INSERT INTO blacklist (full_name, phone, birth_date, reason, added_by, name_key, phone_key, birth_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        [(full_name, phone, normalize_birth_date(birth_date), reason, admin_id, *blacklist_keys(full_name, phone, birth_date))
+         for full_name, phone, birth_date, reason in rows]
+    )
+    for full_name, *_ in rows:
+        _move_to_archive(conn, 'full_name = ?', (full_name,), ARCHIVE_REASON_BLACKLIST)
+    return len(rows)
+
+def import_blacklist(rows, admin_id):
+    return get_writer().execute(_import_blacklist, rows, admin_id)
 
 def add_to_blacklist(full_name, phone, birth_date, reason, admin_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO blacklist (full_name, phone, birth_date, reason, added_by) VALUES (?, ?, ?, ?, ?)', (full_name, phone, birth_date, reason, admin_id))
-    cursor.execute('DELETE FROM staff WHERE full_name = ?', (full_name,))
-    conn.commit()
-    conn.close()
-    return True
+    return get_writer().execute(_add_to_blacklist, full_name, phone, birth_date, reason, admin_id)
+
+@timed
+def _remove_from_blacklist(conn, full_name):
+    # Точное совпадение ФИО (без учёта регистра, ё/е и порядка слов) — оба условия идут по индексам.
+    # Раньше был LIKE '%…%': полный просмотр таблицы и удаление всех, у кого ФИО содержит строку
+    cursor = conn.execute('DELETE FROM blacklist WHERE full_name = ? OR name_key = ?', (full_name, name_key(full_name)))
+    return cursor.rowcount
 
 def remove_from_blacklist(full_name):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM blacklist WHERE full_name LIKE ?', (f'%{full_name}%',))    
-    count = cursor.rowcount
-    conn.commit()
-    conn.close()
-    return count
-
-def get_blacklist():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT full_name, phone, reason, blacklisted_at FROM blacklist ORDER BY blacklisted_at DESC')
-    result = cursor.fetchall()
-    conn.close()
-    return result
+    return get_writer().execute(_remove_from_blacklist, full_name)
+
+@timed
+def get_blacklist_page(cursor=None, direction='older', limit=10):
+    # Keyset-пагинация по (blacklisted_at, id), новые записи — первыми.
+    # cursor — (blacklisted_at, id) крайней записи текущей страницы; direction — 'older' или 'newer'.
+    # Возвращает (строки страницы, есть ли ещё записи в этом направлении)
+    columns = 'id, full_name, phone, reason, blacklisted_at'
+    with get_connection() as conn:
+        if cursor is None:
+            rows = conn.execute(f'SELECT {columns} FROM blacklist ORDER BY blacklisted_at DESC, id DESC LIMIT ?', (limit + 1,)).fetchall()
+        elif direction == 'older':
+            rows = conn.execute(
+                f'SELECT {columns} FROM blacklist WHERE (blacklisted_at, id) < (?, ?) ORDER BY blacklisted_at DESC, id DESC LIMIT ?',
+                (*cursor, limit + 1)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                f'SELECT {columns} FROM blacklist WHERE (blacklisted_at, id) > (?, ?) ORDER BY blacklisted_at, id LIMIT ?',
+                (*cursor, limit + 1)
+            ).fetchall()
+            has_more = len(rows) > limit
+            return list(reversed(rows[:limit])), has_more
+    return rows[:limit], len(rows) > limit
+
+@timed
+def get_blacklist_keys():
+    # Все ключи чёрного списка для загрузки фильтра в память: (id, name_key, phone_key, birth_key)
+    with get_connection() as conn:
+        return conn.execute('SELECT id, name_key, phone_key, birth_key FROM blacklist').fetchall()
+
+@timed
+def get_blacklist_entries(ids):
+    if not ids:
+        return []
+    placeholders = ', '.join('?' for _ in ids)
+    with get_connection() as conn:
+        cursor = conn.execute(f'SELECT id, full_name, phone, birth_date, reason, name_key FROM blacklist WHERE id IN ({placeholders})', list(ids))
+        return cursor.fetchall()
+
+# Мероприятия: события с датой и числом мест, приглашения и атомарная запись на места
+EVENT_COLUMNS = 'id, title, event_date, headcount, reserved'
+
+@timed
+def _create_event(conn, title, event_date, headcount, admin_id):
+    cursor = conn.execute(
+        'INSERT INTO events (title, event_date, headcount, created_by) VALUES (?, ?, ?, ?)',
+        (title, event_date, headcount, admin_id)
+    )
+    return cursor.lastrowid
+
+@timed
+def get_event(event_id):
+    with get_connection() as conn:
+        return conn.execute(f'SELECT {EVENT_COLUMNS} FROM events WHERE id = ?', (event_id,)).fetchone()
+
+@timed
+def get_upcoming_events(today, limit=10):
+    with get_connection() as conn:
+        return conn.execute(
+            f'SELECT {EVENT_COLUMNS} FROM events WHERE event_date >= ? ORDER BY event_date, id LIMIT ?',
+            (today, limit)
+        ).fetchall()
+
+# Кто может работать на мероприятии: медкнижка действует на дату события (диапазон по индексу
+# idx_staff_medbook_expiry), нет в ЧС ни по ФИО, ни по телефону (нормализованные ключи, как в
+# screening.py, — поиск по индексам ЧС для каждой строки), ещё не приглашён на это мероприятие
+# (поиск по первичному ключу приглашений). Строки без ключей (фоновая миграция staff_blacklist_keys
+# до них ещё не дошла) не предлагаются: сверить их с ЧС нечем
+ELIGIBLE_STAFF_SQL = '''
+    FROM staff s
+    WHERE s.medbook_expiry >= :event_date AND s.consent_given = 1 AND s.name_key IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM blacklist b WHERE b.name_key = s.name_key)
+        AND NOT EXISTS (SELECT 1 FROM blacklist b WHERE b.phone_key = s.phone_key)
+        AND NOT EXISTS (SELECT 1 FROM event_invites i WHERE i.event_id = :event_id AND i.telegram_id = s.telegram_id)
+'''
+
+@timed
+def get_eligible_staff(event_id, event_date):
+    # [(telegram_id, full_name)] — ещё не приглашённые официанты, подходящие на мероприятие
+    with get_connection() as conn:
+        return conn.execute(
+            f'SELECT s.telegram_id, s.full_name {ELIGIBLE_STAFF_SQL}',
+            {'event_id': event_id, 'event_date': event_date}
+        ).fetchall()
+
+@timed
+def count_eligible_staff(event_id, event_date):
+    with get_connection() as conn:
+        return conn.execute(
+            f'SELECT COUNT(*) {ELIGIBLE_STAFF_SQL}',
+            {'event_id': event_id, 'event_date': event_date}
+        ).fetchone()[0]
+
+@timed
+def _add_invites(conn, event_id, telegram_ids):
+    conn.executemany(
+        'INSERT OR IGNORE INTO event_invites (event_id, telegram_id) VALUES (?, ?)',
+        [(event_id, telegram_id) for telegram_id in telegram_ids]
+    )
+    return len(telegram_ids)
+
+@timed
+def _forget_invites(conn, event_id, telegram_ids):
+    # Недоставленные приглашения удаляем: следующая рассылка попробует ещё раз
+    conn.executemany(
+        "DELETE FROM event_invites WHERE event_id = ? AND telegram_id = ? AND status = 'invited'",
+        [(event_id, telegram_id) for telegram_id in telegram_ids]
+    )
+
+@timed
+def _answer_invite(conn, event_id, telegram_id, accept):
+    # Возвращает (итог, занято мест): итог — 'accepted', 'declined', 'full', 'unchanged' или 'not_invited'.
+    # Место занимает условный UPDATE: при любом числе одновременных нажатий reserved не превысит headcount
+    row = conn.execute('SELECT status FROM event_invites WHERE event_id = ? AND telegram_id = ?', (event_id, telegram_id)).fetchone()
+    if row is None:
+        return 'not_invited', None
+    status = row[0]
+    if status == ('accepted' if accept else 'declined'):
+        return 'unchanged', None
+    if accept:
+        cursor = conn.execute('UPDATE events SET reserved = reserved + 1 WHERE id = ? AND reserved < headcount RETURNING reserved', (event_id,))
+        reserved = cursor.fetchone()
+        if reserved is None:
+            return 'full', None
+    elif status == 'accepted':
+        # Отказ после согласия освобождает место
+        reserved = conn.execute('UPDATE events SET reserved = reserved - 1 WHERE id = ? RETURNING reserved', (event_id,)).fetchone()
+    else:
+        reserved = conn.execute('SELECT reserved FROM events WHERE id = ?', (event_id,)).fetchone()
+    conn.execute(
+        'UPDATE event_invites SET status = ?, answered_at = CURRENT_TIMESTAMP WHERE event_id = ? AND telegram_id = ?',
+        ('accepted' if accept else 'declined', event_id, telegram_id)
+    )
+    return ('accepted' if accept else 'declined'), reserved[0]
+
+@timed
+def get_invite_counts(event_id):
+    with get_connection() as conn:
+        return dict(conn.execute('SELECT status, COUNT(*) FROM event_invites WHERE event_id = ? GROUP BY status', (event_id,)))
+
+@timed
+def get_event_attendees(event_id):
+    # Согласившиеся в порядке ответа: (ФИО, телефон)
+    with get_connection() as conn:
+        return conn.execute(
+            '''SELECT s.full_name, s.phone FROM event_invites i JOIN staff s ON s.telegram_id = i.telegram_id
+               WHERE i.event_id = ? AND i.status = 'accepted' ORDER BY i.answered_at''',
+            (event_id,)
+        ).fetchall()
+
+def has_consent(telegram_id):
+    # Согласие — часть закэшированного профиля: /start не делает лишнего запроса
+    row = get_staff_by_id(telegram_id)
+    return bool(row and row[5])
+
+@timed
+def _give_consent(conn, telegram_id):
+    cursor = conn.execute('UPDATE staff SET consent_given = 1, updated_at = CURRENT_TIMESTAMP WHERE telegram_id = ?', (telegram_id,))
+    conn.after_commit.append(functools.partial(staff_cache.invalidate, telegram_id))
+    return cursor.rowcount > 0
 
 def staff_exists(telegram_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT 1 FROM staff WHERE telegram_id = ?', (telegram_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result is not None
+    return get_staff_by_id(telegram_id) is not None
 
+def _read_counters(conn):
+    return dict(conn.execute('SELECT name, value FROM counters'))
+
+@timed
 def get_staff_stats():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM staff')
-    total = cursor.fetchone()[0]
-    cursor.execute('SELECT COUNT(*) FROM staff WHERE medbook_status = "просрочена"')
-    expired = cursor.fetchone()[0]
-    cursor.execute('SELECT COUNT(*) FROM blacklist')
-    blacklisted = cursor.fetchone()[0]
-    conn.close()
-    return total, expired, blacklisted
+    with get_connection() as conn:
+        counters = _read_counters(conn)
+    return counters.get('staff_total', 0), counters.get('status:просрочена', 0), counters.get('blacklist_total', 0)
+
+@timed
+def get_counter(name):
+    with get_connection() as conn:
+        row = conn.execute('SELECT value FROM counters WHERE name = ?', (name,)).fetchone()
+    return row[0] if row else 0
+
+_stats_cache = LRUCache(16, STATS_CACHE_TTL)
+
+@timed
+def get_stats_summary(days_list, trend_days=7):
+    # Полная сводка для «📊 Статистика»: счётчики + окна истечения медкнижек + тренды.
+    # Окна считаются одним запросом по индексу (status, expiry), сводка кэшируется на STATS_CACHE_TTL
+    days_list = sorted(set(days_list))
+    cache_key = (tuple(days_list), trend_days)
+    summary = _stats_cache.get(cache_key)
+    if summary is not MISSING:
+        return summary
+    today = date.today()
+    with get_connection() as conn:
+        counters = _read_counters(conn)
+        expiring = {}
+        if days_list:
+            windows = ', '.join('SUM(medbook_expiry <= ?)' for _ in days_list)
+            row = conn.execute(
+                f"SELECT {windows} FROM staff WHERE medbook_status = 'действует' AND medbook_expiry BETWEEN ? AND ?",
+                (*[(today + timedelta(days=d)).isoformat() for d in days_list], today.isoformat(), (today + timedelta(days=days_list[-1])).isoformat())
+            ).fetchone()
+            expiring = {d: value or 0 for d, value in zip(days_list, row)}
+        since = (today - timedelta(days=trend_days - 1)).isoformat()
+        registrations = dict(conn.execute('SELECT day, count FROM registrations_daily WHERE day >= ? ORDER BY day', (since,)))
+        previous = conn.execute(
+            'SELECT day, total, active, expired, blacklisted FROM stats_history WHERE day <= ? ORDER BY day DESC LIMIT 1',
+            ((today - timedelta(days=trend_days)).isoformat(),)
+        ).fetchone()
+    summary = {
+        'total': counters.get('staff_total', 0),
+        'active': counters.get('status:действует', 0),
+        'expired': counters.get('status:просрочена', 0),
+        'pending': counters.get('status:оформляется', 0),
+        'blacklisted': counters.get('blacklist_total', 0),
+        'archived': counters.get('archive_total', 0),
+        'expiring': expiring,
+        'registrations': [((today - timedelta(days=i)).isoformat(), registrations.get((today - timedelta(days=i)).isoformat(), 0)) for i in reversed(range(trend_days))],
+        'previous': previous,
+    }
+    _stats_cache.set(cache_key, summary)
+    return summary
+
+@timed
+def _snapshot_stats(conn, day):
+    counters = _read_counters(conn)
+    conn.execute('''
+        INSERT INTO stats_history (day, total, active, expired, blacklisted) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(day) DO UPDATE SET total = excluded.total, active = excluded.active,
+            expired = excluded.expired, blacklisted = excluded.blacklisted
+    ''', (day, counters.get('staff_total', 0), counters.get('status:действует', 0),
+          counters.get('status:просрочена', 0), counters.get('blacklist_total', 0)))
+
+def snapshot_stats(day=None):
+    return get_writer().execute(_snapshot_stats, (day or date.today()).isoformat())
+
+def get_latest_backup():
+    snapshots = list_snapshots(BACKUP_DIR)
+    return snapshots[-1] if snapshots else None
+
+def _backup_age():
+    latest = get_latest_backup()
+    return {(): round(time.time() - os.path.getmtime(latest))} if latest else {}
+
+Gauge('db_backup_age_seconds', 'Сколько секунд назад создан последний снимок базы', _backup_age)
+
+# Снимки не пересекаются: фоновая задача и /backup ждут друг друга
+_backup_lock = asyncio.Lock()
+
+async def backup_db_async():
+    # Копия идёт в отдельном потоке, а не в пуле run_db: долгий бэкап не занимает соединения хендлеров
+    async with _backup_lock:
+        return await asyncio.to_thread(create_snapshot, DB_PATH, BACKUP_DIR)
+
+# Асинхронные версии запросов для хендлеров бота: чтения выполняются в пуле потоков,
+# записи ставятся в очередь писателя и ждут своего COMMIT без блокировки event loop
+def _async_version(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db(func, *args, **kwargs)
+    return wrapper
+
+def _async_write(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await get_writer().execute_async(func, *args, **kwargs)
+    return wrapper
+
+add_staff_async = _async_write(_add_staff)
+update_medbook_async = _async_write(_update_medbook)
+search_staff_async = _async_version(search_staff)
+
+async def get_staff_by_id_async(telegram_id):
+    # При попадании в кэш отвечаем сразу, без перехода в поток пула
+    row = staff_cache.get(telegram_id)
+    if row is MISSING:
+        row = await run_db(_load_staff, telegram_id)
+    return row
+
+async def staff_exists_async(telegram_id):
+    return await get_staff_by_id_async(telegram_id) is not None
+
+async def has_consent_async(telegram_id):
+    row = await get_staff_by_id_async(telegram_id)
+    return bool(row and row[5])
+
+get_all_staff_async = _async_version(get_all_staff)
+get_expiring_medbooks_async = _async_version(get_expiring_medbooks)
+get_due_reminders_async = _async_version(get_due_reminders)
+sweep_expired_medbooks_async = _async_version(sweep_expired_medbooks)
+give_consent_async = _async_write(_give_consent)
+archive_expired_staff_async = _async_version(archive_expired_staff)
+search_archive_async = _async_version(search_archive)
+get_archived_staff_async = _async_version(get_archived_staff)
+reactivate_staff_async = _async_write(_reactivate_staff)
+mark_reminder_sent_async = _async_write(_mark_reminder_sent)
+add_to_blacklist_async = _async_write(_add_to_blacklist)
+remove_from_blacklist_async = _async_write(_remove_from_blacklist)
+get_blacklist_page_async = _async_version(get_blacklist_page)
+get_blacklist_keys_async = _async_version(get_blacklist_keys)
+get_blacklist_entries_async = _async_version(get_blacklist_entries)
+get_staff_stats_async = _async_version(get_staff_stats)
+get_stats_summary_async = _async_version(get_stats_summary)
+get_counter_async = _async_version(get_counter)
+snapshot_stats_async = _async_version(snapshot_stats)
+create_event_async = _async_write(_create_event)
+get_event_async = _async_version(get_event)
+get_upcoming_events_async = _async_version(get_upcoming_events)
+get_eligible_staff_async = _async_version(get_eligible_staff)
+count_eligible_staff_async = _async_version(count_eligible_staff)
+add_invites_async = _async_write(_add_invites)
+forget_invites_async = _async_write(_forget_invites)
+answer_invite_async = _async_write(_answer_invite)
+get_invite_counts_async = _async_version(get_invite_counts)
+get_event_attendees_async = _async_version(get_event_attendees)
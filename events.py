@@ -0,0 +1,59 @@
+import asyncio
+import logging
+import os
+
+from database import add_invites_async, forget_invites_async, get_eligible_staff_async
+from keyboards import inline_keyboard
+from utils import format_date_for_user
+
+logger = logging.getLogger(__name__)
+
+# Сколько приглашений одновременно ждут своей очереди в отправителе
+INVITE_CONCURRENCY = int(os.getenv('INVITE_CONCURRENCY', '50'))
+# Сколько приглашений записывается в базу одной транзакцией перед отправкой
+INVITE_BATCH = int(os.getenv('INVITE_BATCH', '500'))
+
+# Мероприятия, по которым сейчас идёт рассылка: повторное нажатие не разошлёт приглашения дважды
+_inviting = set()
+
+def invite_text(event):
+    _, title, event_date, headcount, _ = event
+    return (
+        f"📅 Приглашение на мероприятие «{title}», {format_date_for_user(event_date)}.\n"
+        f"Нужно официантов: {headcount}. Места занимаются в порядке ответов.\n\n"
+        "Пойдёте?"
+    )
+
+def invite_kb(event_id):
+    return inline_keyboard([("✅ Иду", f"invite:{event_id}:yes"), ("❌ Не смогу", f"invite:{event_id}:no")])
+
+async def send_invites(sender, event):
+    # Приглашает всех подходящих и ещё не приглашённых официантов через общий отправитель (массовая очередь).
+    # Возвращает (доставлено, подходило) или None, если рассылка по мероприятию уже идёт
+    event_id, _, event_date, _, _ = event
+    if event_id in _inviting:
+        return None
+    _inviting.add(event_id)
+    try:
+        eligible = await get_eligible_staff_async(event_id, event_date)
+        text, kb = invite_text(event), invite_kb(event_id)
+        semaphore = asyncio.Semaphore(INVITE_CONCURRENCY)
+
+        async def invite(telegram_id):
+            async with semaphore:
+                return await sender.send(telegram_id, text, reply_markup=kb)
+
+        delivered = 0
+        for start in range(0, len(eligible), INVITE_BATCH):
+            ids = [telegram_id for telegram_id, _ in eligible[start:start + INVITE_BATCH]]
+            # Приглашение записывается до отправки: ответ по кнопке может прийти раньше, чем закончится рассылка
+            await add_invites_async(event_id, ids)
+            results = await asyncio.gather(*(invite(telegram_id) for telegram_id in ids))
+            failed = [telegram_id for telegram_id, ok in zip(ids, results) if not ok]
+            if failed:
+                await forget_invites_async(event_id, failed)
+            delivered += len(ids) - len(failed)
+        logger.info(f"📨 Мероприятие {event_id}: доставлено приглашений {delivered} из {len(eligible)}")
+        return delivered, len(eligible)
+    finally:
+        _inviting.discard(event_id)
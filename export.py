@@ -0,0 +1,76 @@
+import csv
+import os
+import tempfile
+from datetime import date, timedelta
+
+from database import iter_staff
+from utils import format_date_for_user
+
+try:
+    # XLSX — опционально: без openpyxl доступна только выгрузка в CSV
+    from openpyxl import Workbook
+except ImportError:
+    Workbook = None
+
+EXPORT_HEADER = ['ФИО', 'Дата рождения', 'Телефон', 'Статус медкнижки', 'Медкнижка до']
+EXPORT_EXPIRING_DAYS = int(os.getenv('EXPORT_EXPIRING_DAYS', '30'))
+
+# Фильтры выгрузки: ключ (он же часть callback_data) → (подпись, параметры iter_staff)
+def get_export_filters():
+    today = date.today()
+    return {
+        'all': ('Все', {}),
+        'active': ('Действующие', {'status': 'действует'}),
+        'expired': ('Просроченные', {'status': 'просрочена'}),
+        'expiring': (f'Истекают за {EXPORT_EXPIRING_DAYS} дн.', {
+            'status': 'действует',
+            'expiry_from': today.isoformat(),
+            'expiry_to': (today + timedelta(days=EXPORT_EXPIRING_DAYS)).isoformat(),
+        }),
+    }
+
+def xlsx_available():
+    return Workbook is not None
+
+def _export_rows(filter_key):
+    _, params = get_export_filters()[filter_key]
+    for name, birth, phone, status, expiry in iter_staff(**params):
+        yield [name, format_date_for_user(birth), phone, status, format_date_for_user(expiry)]
+
+def _write_csv(path, rows):
+    count = 0
+    # utf-8-sig и ';' — чтобы файл сразу корректно открывался в русском Excel
+    with open(path, 'w', newline='', encoding='utf-8-sig', buffering=64 * 1024) as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(EXPORT_HEADER)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+def _write_xlsx(path, rows):
+    count = 0
+    # write_only-режим openpyxl пишет строки на диск по мере поступления
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Официанты')
+    ws.append(EXPORT_HEADER)
+    for row in rows:
+        ws.append(row)
+        count += 1
+    wb.save(path)
+    return count
+
+def export_staff(filter_key='all', fmt='csv'):
+    # Блокирующая функция (запускать через run_db): пишет выгрузку во временный файл
+    # и возвращает (путь, количество строк). Файл удаляет вызывающий код после отправки.
+    if fmt == 'xlsx' and not xlsx_available():
+        fmt = 'csv'
+    fd, path = tempfile.mkstemp(prefix='staff-export-', suffix=f'.{fmt}')
+    os.close(fd)
+    try:
+        writer = _write_xlsx if fmt == 'xlsx' else _write_csv
+        count = writer(path, _export_rows(filter_key))
+    except Exception:
+        os.remove(path)
+        raise
+    return path, count
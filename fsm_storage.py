@@ -0,0 +1,104 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+
+from cache import LRUCache, MISSING
+from database import DB_PATH, WriteQueue, apply_pragmas, get_storage_profile
+
+# Состояния FSM храним рядом с waiters.db, чтобы незавершённые регистрации переживали редеплой
+FSM_DB_PATH = os.getenv('FSM_DB_PATH', os.path.join(os.path.dirname(DB_PATH), 'fsm.db'))
+# Через сколько секунд бездействия брошенная сессия FSM удаляется
+FSM_TTL = int(os.getenv('FSM_TTL', str(24 * 3600)))
+FSM_CACHE_SIZE = int(os.getenv('FSM_CACHE_SIZE', '5000'))
+FSM_CACHE_TTL = int(os.getenv('FSM_CACHE_TTL', '600'))
+
+class SQLiteStorage(BaseStorage):
+    # Хранилище FSM в SQLite: чтения обслуживает LRU-кэш в памяти, записи идут
+    # через очередь писателя (group commit) и попадают в кэш сразу
+    def __init__(self, path=FSM_DB_PATH, ttl=FSM_TTL, cache_size=FSM_CACHE_SIZE, cache_ttl=FSM_CACHE_TTL, key_builder=None):
+        self.path = path
+        # Хранилище создаётся при импорте bot.py, раньше init_db: каталог данных может ещё не существовать
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.ttl = ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.cache = LRUCache(cache_size, min(cache_ttl, ttl))
+        self.writer = WriteQueue(path)
+        self._reader_lock = threading.Lock()
+        self._reader = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._reader.execute(f"PRAGMA journal_mode = {get_storage_profile()['journal_mode']}")
+        apply_pragmas(self._reader)
+        self._reader.execute('''
+            CREATE TABLE IF NOT EXISTS fsm (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL DEFAULT '{}',
+                updated_at REAL NOT NULL
+            )
+        ''')
+        self._reader.execute('CREATE INDEX IF NOT EXISTS idx_fsm_updated_at ON fsm (updated_at)')
+        self._reader.commit()
+
+    def _read(self, key):
+        with self._reader_lock:
+            row = self._reader.execute('SELECT state, data, updated_at FROM fsm WHERE key = ?', (key,)).fetchone()
+        if row is None or row[2] < time.time() - self.ttl:
+            return None, {}
+        return row[0], json.loads(row[1])
+
+    async def _load(self, key):
+        record = self.cache.get(key)
+        if record is MISSING:
+            record = await asyncio.to_thread(self._read, key)
+            self.cache.set(key, record)
+        return record
+
+    @staticmethod
+    def _save(conn, key, state, data):
+        if state is None and not data:
+            conn.execute('DELETE FROM fsm WHERE key = ?', (key,))
+            return
+        conn.execute('''
+            INSERT INTO fsm (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+        ''', (key, state, json.dumps(data, ensure_ascii=False), time.time()))
+
+    async def _store(self, key, state, data):
+        self.cache.set(key, (state, data))
+        await self.writer.execute_async(self._save, key, state, data)
+
+    async def set_state(self, key, state=None):
+        key = self.key_builder.build(key)
+        _, data = await self._load(key)
+        await self._store(key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key):
+        state, _ = await self._load(self.key_builder.build(key))
+        return state
+
+    async def set_data(self, key, data):
+        key = self.key_builder.build(key)
+        state, _ = await self._load(key)
+        await self._store(key, state, dict(data))
+
+    async def get_data(self, key):
+        _, data = await self._load(self.key_builder.build(key))
+        return dict(data)
+
+    @staticmethod
+    def _expire(conn, deadline):
+        return conn.execute('DELETE FROM fsm WHERE updated_at < ?', (deadline,)).rowcount
+
+    async def expire(self):
+        # Удаляет брошенные сессии; кэш живёт не дольше TTL, так что отдельно его чистить не нужно
+        return await self.writer.execute_async(self._expire, time.time() - self.ttl)
+
+    async def close(self):
+        await asyncio.to_thread(self.writer.close)
+        with self._reader_lock:
+            self._reader.close()
@@ -0,0 +1,151 @@
+import csv
+import os
+from datetime import datetime
+
+from database import import_blacklist, import_staff
+from utils import format_date_for_db, validate_date, validate_phone
+
+try:
+    # XLSX — опционально: без openpyxl принимаются только CSV
+    from openpyxl import load_workbook
+except ImportError:
+    load_workbook = None
+
+# Сколько строк уходит в базу одной транзакцией
+IMPORT_BATCH = int(os.getenv('IMPORT_BATCH', '500'))
+
+# Допустимые названия колонок (в нижнем регистре) → поле
+COLUMN_ALIASES = {
+    'telegram_id': 'telegram_id', 'telegram id': 'telegram_id', 'id telegram': 'telegram_id',
+    'фио': 'full_name', 'full_name': 'full_name',
+    'дата рождения': 'birth_date', 'др': 'birth_date', 'birth_date': 'birth_date',
+    'телефон': 'phone', 'phone': 'phone',
+    'медкнижка до': 'medbook_expiry', 'medbook_expiry': 'medbook_expiry',
+    'причина': 'reason', 'reason': 'reason',
+    'согласие': 'consent', 'согласие на пд': 'consent', 'consent': 'consent',
+}
+# Значения колонки «согласие», означающие, что согласие на обработку ПД получено
+CONSENT_VALUES = frozenset({'1', 'да', 'yes', 'true', '+'})
+IMPORT_COLUMNS = {
+    'staff': ('telegram_id', 'full_name', 'birth_date', 'phone', 'medbook_expiry', 'consent'),
+    'blacklist': ('full_name', 'phone', 'birth_date', 'reason'),
+}
+# Колонка «согласие» необязательна: без неё официанты импортируются без согласия на обработку ПД —
+# напоминания и приглашения им не уходят, пока они сами не подтвердят согласие через /start
+REQUIRED_COLUMNS = {
+    'staff': ('telegram_id', 'full_name', 'birth_date', 'phone', 'medbook_expiry'),
+    'blacklist': ('full_name', 'reason'),
+}
+
+class ImportFileError(Exception):
+    pass
+
+def _iter_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=';,\t')
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.reader(f, dialect)
+
+def _iter_xlsx(path):
+    if load_workbook is None:
+        raise ImportFileError("Для XLSX нужен openpyxl — загрузите CSV")
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in wb.active.iter_rows(values_only=True):
+            yield ['' if value is None else value.strftime('%d.%m.%Y') if isinstance(value, datetime) else str(value) for value in row]
+    finally:
+        wb.close()
+
+def iter_file_rows(path):
+    # Построчное чтение файла: весь файл в память не загружается
+    return _iter_xlsx(path) if path.lower().endswith('.xlsx') else _iter_csv(path)
+
+def _parse_header(header, target):
+    columns = {}
+    for i, title in enumerate(header):
+        field = COLUMN_ALIASES.get(str(title).strip().lower())
+        if field in IMPORT_COLUMNS[target] and field not in columns:
+            columns[field] = i
+    missing = [field for field in REQUIRED_COLUMNS[target] if field not in columns]
+    if missing:
+        raise ImportFileError(f"В файле нет колонок: {', '.join(missing)}")
+    return columns
+
+def _validate_staff(values):
+    telegram_id, full_name, birth_date, phone, medbook_expiry, consent = values
+    phone = phone.replace(' ', '')
+    if not telegram_id.isdigit():
+        return None, "telegram_id должен быть числом"
+    if len(full_name) < 5:
+        return None, "ФИО короче 5 символов"
+    if not validate_date(birth_date):
+        return None, "дата рождения не в формате ДД.ММ.ГГГГ"
+    if not validate_phone(phone):
+        return None, "телефон не в формате +79991234567"
+    if not validate_date(medbook_expiry):
+        return None, "дата медкнижки не в формате ДД.ММ.ГГГГ"
+    return (int(telegram_id), full_name, format_date_for_db(birth_date), phone, format_date_for_db(medbook_expiry), int(consent.lower() in CONSENT_VALUES)), None
+
+def _validate_blacklist(values):
+    full_name, phone, birth_date, reason = values
+    phone = phone.replace(' ', '') or None
+    if len(full_name) < 5:
+        return None, "ФИО короче 5 символов"
+    if phone and not validate_phone(phone):
+        return None, "телефон не в формате +79991234567"
+    if birth_date and not validate_date(birth_date):
+        return None, "дата рождения не в формате ДД.ММ.ГГГГ"
+    if not reason:
+        return None, "не указана причина"
+    return (full_name, phone, birth_date or None, reason), None
+
+def _blacklist_error(matches):
+    _, bl_name, _, _, reason, signs = matches[0]
+    return f"совпадает с ЧС: {bl_name} ({', '.join(signs)}), причина: {reason}"
+
+def import_file(path, target, admin_id, screen=None):
+    # Блокирующая функция (запускать через run_db). Возвращает (импортировано, [(строка, ошибка)]).
+    # screen(full_name, phone, birth_date) — сверка с ЧС, как при регистрации в боте: совпавшие
+    # официанты не импортируются и попадают в ошибки
+    rows = iter_file_rows(path)
+    header = next(rows, None)
+    if header is None:
+        raise ImportFileError("Файл пустой")
+    columns = _parse_header(header, target)
+    validate = _validate_staff if target == 'staff' else _validate_blacklist
+    imported, errors, batch = 0, [], []
+
+    def flush():
+        if target == 'staff':
+            return import_staff(batch)
+        return import_blacklist(batch, admin_id)
+
+    for line_no, row in enumerate(rows, start=2):
+        if not any(str(value).strip() for value in row):
+            continue
+        values = [str(row[columns[field]]).strip() if field in columns and columns[field] < len(row) else '' for field in IMPORT_COLUMNS[target]]
+        record, error = validate(values)
+        if not error and target == 'staff' and screen is not None:
+            matches = screen(record[1], record[3], record[2])
+            if matches:
+                error = _blacklist_error(matches)
+        if error:
+            errors.append((line_no, error))
+            continue
+        batch.append(record)
+        if len(batch) >= IMPORT_BATCH:
+            imported += flush()
+            batch = []
+    if batch:
+        imported += flush()
+    return imported, errors
+
+def write_error_report(path, errors):
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(['Строка', 'Ошибка'])
+        writer.writerows(errors)
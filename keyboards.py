@@ -0,0 +1,49 @@
+from pydantic import ConfigDict
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
+
+# Клавиатуры собираются один раз при импорте и переиспользуются во всех ответах.
+# Модели заморожены: случайное изменение общей клавиатуры в хендлере — ошибка, а не порча для всех
+
+class FrozenReplyKeyboard(ReplyKeyboardMarkup):
+    model_config = ConfigDict(frozen=True)
+
+class FrozenInlineKeyboard(InlineKeyboardMarkup):
+    model_config = ConfigDict(frozen=True)
+
+def reply_keyboard(*rows, one_time=False):
+    return FrozenReplyKeyboard(
+        keyboard=[[KeyboardButton(text=text) for text in row] for row in rows],
+        resize_keyboard=True,
+        one_time_keyboard=one_time or None,
+    )
+
+def inline_keyboard(*rows):
+    # rows — списки пар (текст, callback_data)
+    return FrozenInlineKeyboard(inline_keyboard=[
+        [InlineKeyboardButton(text=text, callback_data=data) for text, data in row] for row in rows
+    ])
+
+# Тексты кнопок — они же ключи маршрутизации меню (см. routing.py)
+BTN_MY_DATA = "👤 Мои данные"
+BTN_UPDATE_MEDBOOK = "🔄 Обновить медкнижку"
+BTN_HELP = "ℹ️ Помощь"
+BTN_ADMIN_PANEL = "👑 Админ-панель"
+BTN_SEARCH = "🔍 Поиск по фамилии"
+BTN_STATS = "📊 Статистика"
+BTN_EXPORT = "📤 Выгрузить всех"
+BTN_BLACKLIST = "🚫 Чёрный список"
+BTN_IMPORT = "📥 Импорт из файла"
+BTN_EVENTS = "📅 Мероприятия"
+BTN_BACK = "⬅️ Назад"
+BTN_CANCEL = "Отмена"
+BTN_CONSENT = "Согласен"
+
+MAIN_KB = reply_keyboard([BTN_MY_DATA], [BTN_UPDATE_MEDBOOK], [BTN_HELP])
+MAIN_ADMIN_KB = reply_keyboard([BTN_ADMIN_PANEL], [BTN_MY_DATA], [BTN_UPDATE_MEDBOOK], [BTN_HELP])
+ADMIN_KB = reply_keyboard([BTN_SEARCH], [BTN_STATS], [BTN_EXPORT], [BTN_BLACKLIST], [BTN_IMPORT], [BTN_EVENTS], [BTN_BACK])
+CANCEL_KB = reply_keyboard([BTN_CANCEL])
+CONSENT_KB = reply_keyboard([BTN_CONSENT], one_time=True)
+IMPORT_TARGET_KB = inline_keyboard(
+    [("👥 Официанты", "import:staff")],
+    [("🚫 Чёрный список", "import:blacklist")],
+)
@@ -0,0 +1,239 @@
+import functools
+import inspect
+import os
+import sqlite3
+import threading
+import time
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+
+# Порт отдельного сервера /metrics в режиме polling (в режиме webhook /metrics висит на том же сервере)
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REGISTRY = []
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def items(self):
+        with self._lock:
+            return list(self._values.items())
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for label_values, value in sorted(self.items()):
+            lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {value}')
+        return lines
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # label_values → [счётчики по корзинам..., +Inf, сумма]
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            counts = self._values.get(label_values)
+            if counts is None:
+                counts = self._values[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    def summary(self):
+        # label_values → (количество, среднее, оценка p50, оценка p99) по границам корзин
+        result = {}
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        for label_values, counts in items:
+            total = sum(counts[:-1])
+            result[label_values] = (total, counts[-1] / total, self._quantile(counts, total, 0.5), self._quantile(counts, total, 0.99))
+        return result
+
+    def _quantile(self, counts, total, q):
+        seen = 0
+        for i, bound in enumerate(self.buckets):
+            seen += counts[i]
+            if seen >= q * total:
+                return bound
+        return float('inf')
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        for label_values, counts in items:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                labels = _format_labels((*self.labels, 'le'), (*label_values, bound))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {counts[-1]}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+class Gauge:
+    # Значение считывается в момент отдачи метрик: func() → {label_values: value}
+    def __init__(self, name, help_text, func, labels=()):
+        self.name = name
+        self.help = help_text
+        self.func = func
+        self.labels = labels
+        REGISTRY.append(self)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge']
+        for label_values, value in sorted(self.func().items()):
+            lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {value}')
+        return lines
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+handler_latency = Histogram('bot_handler_latency_seconds', 'Время работы хендлера', ('handler',))
+handler_errors = Counter('bot_handler_errors_total', 'Исключения в хендлерах', ('handler',))
+fsm_transitions = Counter('bot_fsm_transitions_total', 'Переходы между состояниями FSM', ('from_state', 'to_state'))
+db_query_latency = Histogram('db_query_latency_seconds', 'Время выполнения запросов database.py', ('query',))
+db_query_rows = Counter('db_query_rows_total', 'Строк прочитано/изменено запросами database.py', ('query',))
+db_query_errors = Counter('db_query_errors_total', 'Ошибки запросов database.py', ('query',))
+
+def _count_rows(result):
+    if isinstance(result, bool):
+        return int(result)
+    if isinstance(result, int):
+        return result
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, tuple) and len(result) == 2 and isinstance(result[1], list):
+        return len(result[1])
+    return 0 if result is None else 1
+
+def timed(func):
+    # Замер времени и числа строк для функций database.py. Для функций записи (первый
+    # аргумент — соединение писателя) строки считаются по conn.total_changes
+    name = func.__name__.lstrip('_')
+
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            rows = 0
+            try:
+                for row in func(*args, **kwargs):
+                    rows += 1
+                    yield row
+            finally:
+                db_query_latency.observe(time.perf_counter() - started, name)
+                db_query_rows.inc(name, amount=rows)
+        return generator_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        conn = args[0] if args and isinstance(args[0], sqlite3.Connection) else None
+        changes = conn.total_changes if conn is not None else 0
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            db_query_errors.inc(name)
+            raise
+        finally:
+            db_query_latency.observe(time.perf_counter() - started, name)
+        rows = conn.total_changes - changes if conn is not None else _count_rows(result)
+        db_query_rows.inc(name, amount=rows)
+        return result
+    return wrapper
+
+def handler_name(data):
+    # Для кнопок меню сработавший хендлер — dispatch, а настоящий лежит в данных фильтра-таблицы (routing.py)
+    handler = data.get('table_handler') or data['handler'].callback
+    return handler.__name__
+
+class MetricsMiddleware(BaseMiddleware):
+    # Inner-middleware роутера: вызывается уже для выбранного хендлера,
+    # поэтому в data['handler'] известно, какой именно хендлер сработал
+    async def __call__(self, handler, event, data):
+        name = handler_name(data)
+        state = data.get('state')
+        before = await state.get_state() if state else None
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_latency.observe(time.perf_counter() - started, name)
+            if state:
+                after = await state.get_state()
+                if after != before:
+                    fsm_transitions.inc(before or 'none', after or 'none')
+
+async def metrics_handler(request):
+    return web.Response(text=render_metrics(), content_type='text/plain', charset='utf-8')
+
+def add_metrics_route(app):
+    app.router.add_get('/metrics', metrics_handler)
+
+async def start_metrics_server(port=METRICS_PORT):
+    # Возвращает runner (для cleanup при остановке) или None, если порт не задан
+    if not port:
+        return None
+    app = web.Application()
+    add_metrics_route(app)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', port).start()
+    return runner
+
+def format_perf_report(limit=10):
+    # Краткая сводка для команды /perf: самые медленные хендлеры и запросы
+    def section(title, histogram):
+        rows = sorted(histogram.summary().items(), key=lambda item: item[1][3], reverse=True)[:limit]
+        if not rows:
+            return f"{title}\n— нет данных\n"
+        text = f"{title}\n"
+        for (name,), (count, avg, p50, p99) in rows:
+            text += f"• {name}: n={count}, avg={avg * 1000:.1f} мс, p50≤{p50 * 1000:g} мс, p99≤{p99 * 1000:g} мс\n"
+        return text
+
+    errors = sum(value for _, value in handler_errors.items())
+    transitions = sum(value for _, value in fsm_transitions.items())
+    return (
+        "📈 Производительность\n\n"
+        + section("⏱ Хендлеры:", handler_latency) + "\n"
+        + section("🗄 Запросы к БД:", db_query_latency) + "\n"
+        + f"❌ Ошибок в хендлерах: {errors}\n🔀 Переходов FSM: {transitions}\n"
+    )
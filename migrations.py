@@ -0,0 +1,348 @@
+import logging
+
+from utils import blacklist_keys, format_phone_for_db, normalize_birth_date
+
+logger = logging.getLogger(__name__)
+
+# Версия схемы хранится в PRAGMA user_version: при старте выполняются только миграции
+# с номером больше текущего, каждая — в своей транзакции вместе с записью новой версии.
+# Миграции 1–4 повторяют прежний init_db и идемпотентны, поэтому база, созданная
+# до появления версий, проходит их без изменений и просто получает номер версии
+
+def create_base_schema(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS staff (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER UNIQUE NOT NULL,
+            full_name TEXT NOT NULL,
+            birth_date TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            medbook_status TEXT CHECK(medbook_status IN ('действует', 'просрочена', 'оформляется')) DEFAULT 'действует',
+            medbook_expiry DATE NOT NULL,
+            consent_given BOOLEAN DEFAULT 0,
+            registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS blacklist (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            full_name TEXT NOT NULL,
+            phone TEXT,
+            birth_date TEXT,
+            reason TEXT NOT NULL,
+            blacklisted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            added_by INTEGER NOT NULL
+        )
+    ''')
+    # Индекс по ФИО: выгрузка идёт в алфавитном порядке без сортировки всей таблицы
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_staff_full_name ON staff (full_name)')
+    # Для выборок «действующие с истекающим/истёкшим сроком» — напоминания и sweep
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_staff_status_expiry ON staff (medbook_status, medbook_expiry)')
+    # Служебные значения (например, водяной знак sweep-а просроченных медкнижек)
+    cursor.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+    # Журнал отправленных напоминаний: после рестарта одно и то же напоминание не уйдёт дважды
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reminders_sent (
+            telegram_id INTEGER NOT NULL,
+            medbook_expiry DATE NOT NULL,
+            days_before INTEGER NOT NULL,
+            sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (telegram_id, medbook_expiry, days_before)
+        )
+    ''')
+
+# Полнотекстовый индекс по ФИО и телефону: rowid = staff.id, синхронизируется триггерами.
+# Регистр сворачивает токенизатор unicode61, а ё→е заменяем сами и в индексе, и в запросе
+SEARCH_INDEX_NAME_SQL = "replace(replace({0}.full_name, 'ё', 'е'), 'Ё', 'Е')"
+# Телефон в staff хранится в едином виде +7XXXXXXXXXX (utils.format_phone_for_db), в индексе — без «+»
+SEARCH_INDEX_PHONE_SQL = "replace({0}.phone, '+', '')"
+
+def init_search_index(cursor):
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'staff_search'").fetchone()
+    cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS staff_search USING fts5(name, phone, tokenize = 'unicode61')")
+    new_values = f"new.id, {SEARCH_INDEX_NAME_SQL.format('new')}, {SEARCH_INDEX_PHONE_SQL.format('new')}"
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS staff_search_insert AFTER INSERT ON staff BEGIN
+            INSERT INTO staff_search (rowid, name, phone) VALUES ({new_values});
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS staff_search_delete AFTER DELETE ON staff BEGIN
+            DELETE FROM staff_search WHERE rowid = old.id;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS staff_search_update AFTER UPDATE OF full_name, phone ON staff BEGIN
+            DELETE FROM staff_search WHERE rowid = old.id;
+            INSERT INTO staff_search (rowid, name, phone) VALUES ({new_values});
+        END
+    ''')
+    if not exists:
+        # Первое создание индекса на существующей базе — заполняем его одним запросом
+        cursor.execute(f'''
+            INSERT INTO staff_search (rowid, name, phone)
+            SELECT id, {SEARCH_INDEX_NAME_SQL.format('staff')}, {SEARCH_INDEX_PHONE_SQL.format('staff')} FROM staff
+        ''')
+
+# Нормализованные ключи чёрного списка для быстрой проверки новых регистраций (см. screening.py)
+BLACKLIST_KEY_COLUMNS = ('name_key', 'phone_key', 'birth_key')
+
+def init_blacklist_keys(cursor):
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(blacklist)')}
+    missing = [column for column in BLACKLIST_KEY_COLUMNS if column not in columns]
+    for column in missing:
+        cursor.execute(f'ALTER TABLE blacklist ADD COLUMN {column} TEXT')
+    for column in BLACKLIST_KEY_COLUMNS:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_blacklist_{column} ON blacklist ({column})')
+    # Для постраничного просмотра ЧС: каждая страница читает только свои строки
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_blacklist_blacklisted_at ON blacklist (blacklisted_at, id)')
+    if missing:
+        # Старые записи: считаем ключи один раз при добавлении колонок
+        rows = cursor.execute('SELECT id, full_name, phone, birth_date FROM blacklist').fetchall()
+        cursor.executemany(
+            'UPDATE blacklist SET name_key = ?, phone_key = ?, birth_key = ? WHERE id = ?',
+            [(*blacklist_keys(name, phone, birth), row_id) for row_id, name, phone, birth in rows]
+        )
+
+# Счётчики статистики, которые триггеры обновляют при каждой записи: статистика не сканирует таблицы.
+# Регистрации за день триггер не считает: строки в staff добавляют и импорт, и возврат из архива,
+# поэтому registrations_daily увеличивает только регистрация в боте (database._add_staff)
+COUNTER_TRIGGERS = {
+    'counters_staff_insert': '''AFTER INSERT ON staff BEGIN
+        UPDATE counters SET value = value + 1 WHERE name IN ('staff_total', 'status:' || new.medbook_status);
+    END''',
+    'counters_staff_delete': '''AFTER DELETE ON staff BEGIN
+        UPDATE counters SET value = value - 1 WHERE name IN ('staff_total', 'status:' || old.medbook_status);
+    END''',
+    'counters_staff_status': '''AFTER UPDATE OF medbook_status ON staff WHEN old.medbook_status IS NOT new.medbook_status BEGIN
+        UPDATE counters SET value = value - 1 WHERE name = 'status:' || old.medbook_status;
+        UPDATE counters SET value = value + 1 WHERE name = 'status:' || new.medbook_status;
+    END''',
+    'counters_blacklist_insert': '''AFTER INSERT ON blacklist BEGIN
+        UPDATE counters SET value = value + 1 WHERE name = 'blacklist_total';
+    END''',
+    'counters_blacklist_delete': '''AFTER DELETE ON blacklist BEGIN
+        UPDATE counters SET value = value - 1 WHERE name = 'blacklist_total';
+    END''',
+    # Версия ЧС растёт при любом изменении: воркеры кластера по ней узнают, что пора перечитать фильтр
+    'counters_blacklist_version_insert': '''AFTER INSERT ON blacklist BEGIN
+        UPDATE counters SET value = value + 1 WHERE name = 'blacklist_version';
+    END''',
+    'counters_blacklist_version_delete': '''AFTER DELETE ON blacklist BEGIN
+        UPDATE counters SET value = value + 1 WHERE name = 'blacklist_version';
+    END''',
+}
+
+def init_counters(cursor):
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'counters'").fetchone()
+    cursor.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL DEFAULT 0)')
+    cursor.execute('CREATE TABLE IF NOT EXISTS registrations_daily (day TEXT PRIMARY KEY, count INTEGER NOT NULL DEFAULT 0)')
+    # Ежедневные снимки для трендов (пишет фоновая задача, см. snapshot_stats)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stats_history (
+            day TEXT PRIMARY KEY,
+            total INTEGER NOT NULL,
+            active INTEGER NOT NULL,
+            expired INTEGER NOT NULL,
+            blacklisted INTEGER NOT NULL
+        )
+    ''')
+    for name, body in COUNTER_TRIGGERS.items():
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {body}')
+    cursor.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('blacklist_version', 0)")
+    if not exists:
+        # Первый запуск на существующей базе: один раз считаем всё честно
+        cursor.execute('''
+            INSERT INTO counters (name, value)
+            SELECT 'staff_total', COUNT(*) FROM staff
+            UNION ALL SELECT 'status:действует', COUNT(*) FROM staff WHERE medbook_status = 'действует'
+            UNION ALL SELECT 'status:просрочена', COUNT(*) FROM staff WHERE medbook_status = 'просрочена'
+            UNION ALL SELECT 'status:оформляется', COUNT(*) FROM staff WHERE medbook_status = 'оформляется'
+            UNION ALL SELECT 'blacklist_total', COUNT(*) FROM blacklist
+        ''')
+        cursor.execute('''
+            INSERT INTO registrations_daily (day, count)
+            SELECT date(registered_at, 'localtime'), COUNT(*) FROM staff GROUP BY 1
+        ''')
+
+def create_lookup_indexes(cursor):
+    # Удаление из ЧС ищет по ФИО, проверки — по телефону; выборки по сроку медкнижки без статуса
+    # (выгрузка по диапазону дат, приглашения на мероприятия) идут по отдельному индексу
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_blacklist_full_name ON blacklist (full_name)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_blacklist_phone ON blacklist (phone)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_staff_medbook_expiry ON staff (medbook_expiry)')
+
+def create_events(cursor):
+    # Мероприятия: reserved — сколько мест уже занято согласившимися, никогда не больше headcount
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            event_date DATE NOT NULL,
+            headcount INTEGER NOT NULL CHECK(headcount > 0),
+            reserved INTEGER NOT NULL DEFAULT 0 CHECK(reserved >= 0 AND reserved <= headcount),
+            created_by INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_date ON events (event_date)')
+    # Приглашения: одно на официанта в рамках мероприятия, статус меняется по кнопкам в сообщении
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS event_invites (
+            event_id INTEGER NOT NULL REFERENCES events (id),
+            telegram_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'invited' CHECK(status IN ('invited', 'accepted', 'declined')),
+            invited_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            answered_at TIMESTAMP,
+            PRIMARY KEY (event_id, telegram_id)
+        ) WITHOUT ROWID
+    ''')
+
+# Архив: ушедшие и давно просроченные официанты (и те, кого внесли в ЧС) переносятся сюда из staff,
+# чтобы рабочая таблица и её индексы не росли вместе с историей. id сохраняется при переносе в обе стороны
+ARCHIVE_TRIGGERS = {
+    'staff_archive_search_insert': f'''AFTER INSERT ON staff_archive BEGIN
+        INSERT INTO staff_archive_search (rowid, name, phone) VALUES (new.id, {SEARCH_INDEX_NAME_SQL.format('new')}, {SEARCH_INDEX_PHONE_SQL.format('new')});
+        UPDATE counters SET value = value + 1 WHERE name = 'archive_total';
+    END''',
+    'staff_archive_search_delete': '''AFTER DELETE ON staff_archive BEGIN
+        DELETE FROM staff_archive_search WHERE rowid = old.id;
+        UPDATE counters SET value = value - 1 WHERE name = 'archive_total';
+    END''',
+}
+
+def create_staff_archive(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS staff_archive (
+            id INTEGER PRIMARY KEY,
+            telegram_id INTEGER UNIQUE NOT NULL,
+            full_name TEXT NOT NULL,
+            birth_date TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            medbook_status TEXT,
+            medbook_expiry DATE NOT NULL,
+            consent_given BOOLEAN DEFAULT 0,
+            registered_at TIMESTAMP,
+            updated_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            archive_reason TEXT NOT NULL
+        )
+    ''')
+    # Поиск по архиву — только по явному запросу админа, тем же полнотекстовым запросом, что и по staff
+    cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS staff_archive_search USING fts5(name, phone, tokenize = 'unicode61')")
+    for name, body in ARCHIVE_TRIGGERS.items():
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {body}')
+    cursor.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('archive_total', 0)")
+
+# Те же нормализованные ключи у staff: подбор на мероприятие сверяется с ЧС по индексам
+# с обеих сторон, и регистр, порядок слов и форма записи телефона ЧС не обходят
+STAFF_KEY_COLUMNS = ('name_key', 'phone_key')
+
+def init_staff_keys(cursor):
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(staff)')}
+    missing = [column for column in STAFF_KEY_COLUMNS if column not in columns]
+    for column in missing:
+        cursor.execute(f'ALTER TABLE staff ADD COLUMN {column} TEXT')
+    for column in STAFF_KEY_COLUMNS:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_staff_{column} ON staff ({column})')
+    # Ключи старых строк заполняет фоновая миграция данных staff_blacklist_keys
+
+# Дата возврата из архива: вернувшийся с просроченной медкнижкой не уходит обратно в архив
+# при ближайшем переносе, пока не истечёт льготный срок (см. database.archive_expired_staff)
+def add_staff_reactivated_at(cursor):
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(staff)')}
+    if 'reactivated_at' not in columns:
+        cursor.execute('ALTER TABLE staff ADD COLUMN reactivated_at DATE')
+
+def recreate_staff_insert_trigger(cursor):
+    # Базы до миграции 10 получили триггер, считавший регистрацией любую вставку в staff
+    cursor.execute('DROP TRIGGER IF EXISTS counters_staff_insert')
+    cursor.execute(f"CREATE TRIGGER counters_staff_insert {COUNTER_TRIGGERS['counters_staff_insert']}")
+
+MIGRATIONS = [
+    (1, 'таблицы staff, blacklist, meta, reminders_sent', create_base_schema),
+    (2, 'полнотекстовый поиск по staff', init_search_index),
+    (3, 'ключи чёрного списка', init_blacklist_keys),
+    (4, 'счётчики статистики', init_counters),
+    (5, 'индексы по ФИО и телефону ЧС, по сроку медкнижки', create_lookup_indexes),
+    (6, 'мероприятия и приглашения', create_events),
+    (7, 'архив официантов', create_staff_archive),
+    (8, 'ключи ФИО и телефона у staff', init_staff_keys),
+    (9, 'дата возврата из архива', add_staff_reactivated_at),
+    (10, 'регистрации за день — только из бота', recreate_staff_insert_trigger),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn):
+    # Возвращает версию схемы до миграции
+    version = get_schema_version(conn)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"Версия схемы базы {version} новее поддерживаемой ({SCHEMA_VERSION})")
+    for number, title, func in MIGRATIONS:
+        if number <= version:
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            func(conn.cursor())
+            conn.execute(f'PRAGMA user_version = {number}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info(f"✅ Миграция схемы {number}: {title}")
+    return version
+
+# Миграции данных переписывают строки пачками через очередь писателя, пока бот уже работает:
+# большая база не блокирует старт. Прогресс (последний обработанный id) хранится в meta
+# в той же транзакции, что и пачка, поэтому после рестарта работа продолжается с того же места.
+# Пока миграция идёт, код должен понимать и старый, и новый формат данных
+
+def blacklist_birth_to_iso(conn, after_id, limit):
+    # ДД.ММ.ГГГГ → ГГГГ-ММ-ДД: даты рождения в ЧС сравниваются и сортируются как в staff
+    rows = conn.execute('SELECT id, birth_date FROM blacklist WHERE id > ? ORDER BY id LIMIT ?', (after_id, limit)).fetchall()
+    updates = [(normalize_birth_date(birth), row_id) for row_id, birth in rows if birth]
+    conn.executemany('UPDATE blacklist SET birth_date = ? WHERE id = ?', [(birth, row_id) for birth, row_id in updates if birth])
+    return rows[-1][0] if rows else None
+
+def staff_phone_canonical(conn, after_id, limit):
+    # «+7(999)000-00-03» → «+79990000003»: телефон в поисковом индексе — одно слово, как и в запросе.
+    # Индекс staff_search обновляет триггер на UPDATE OF phone
+    rows = conn.execute('SELECT id, phone FROM staff WHERE id > ? ORDER BY id LIMIT ?', (after_id, limit)).fetchall()
+    conn.executemany('UPDATE staff SET phone = ? WHERE id = ?', [
+        (format_phone_for_db(phone), row_id) for row_id, phone in rows if format_phone_for_db(phone) != phone
+    ])
+    return rows[-1][0] if rows else None
+
+def staff_archive_phone_canonical(conn, after_id, limit):
+    # То же для архива; у архивного индекса нет триггера на UPDATE — строку индекса пересобираем сами
+    rows = conn.execute('SELECT id, phone FROM staff_archive WHERE id > ? ORDER BY id LIMIT ?', (after_id, limit)).fetchall()
+    for row_id, phone in rows:
+        if format_phone_for_db(phone) == phone:
+            continue
+        conn.execute('UPDATE staff_archive SET phone = ? WHERE id = ?', (format_phone_for_db(phone), row_id))
+        conn.execute('DELETE FROM staff_archive_search WHERE rowid = ?', (row_id,))
+        conn.execute(f'''
+            INSERT INTO staff_archive_search (rowid, name, phone)
+            SELECT id, {SEARCH_INDEX_NAME_SQL.format('staff_archive')}, {SEARCH_INDEX_PHONE_SQL.format('staff_archive')} FROM staff_archive WHERE id = ?
+        ''', (row_id,))
+    return rows[-1][0] if rows else None
+
+def staff_blacklist_keys(conn, after_id, limit):
+    # Ключи для сверки с ЧС у строк, записанных до миграции схемы 8. Пока у строки нет ключа,
+    # подбор на мероприятие её не предлагает (см. database.ELIGIBLE_STAFF_SQL)
+    rows = conn.execute('SELECT id, full_name, phone, name_key FROM staff WHERE id > ? ORDER BY id LIMIT ?', (after_id, limit)).fetchall()
+    conn.executemany('UPDATE staff SET name_key = ?, phone_key = ? WHERE id = ?', [
+        (*blacklist_keys(name, phone, None)[:2], row_id) for row_id, name, phone, key in rows if key is None
+    ])
+    return rows[-1][0] if rows else None
+
+DATA_MIGRATIONS = [
+    ('blacklist_birth_iso', blacklist_birth_to_iso),
+    ('staff_phone_canonical', staff_phone_canonical),
+    ('staff_archive_phone_canonical', staff_archive_phone_canonical),
+    ('staff_blacklist_keys', staff_blacklist_keys),
+]
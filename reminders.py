@@ -0,0 +1,56 @@
+import asyncio
+import logging
+import os
+from datetime import date
+
+from database import get_due_reminders_async, mark_reminder_sent_async
+from sender import RateLimitedSender
+from tasks import PeriodicTask
+from utils import format_date_for_user
+
+logger = logging.getLogger(__name__)
+
+REMINDER_INTERVAL = int(os.getenv('REMINDER_INTERVAL', '3600'))
+# Сколько напоминаний одновременно ждут своей очереди в отправителе
+REMINDER_CONCURRENCY = int(os.getenv('REMINDER_CONCURRENCY', '50'))
+
+class ReminderScheduler:
+    def __init__(self, bot, days, interval=REMINDER_INTERVAL, sender=None):
+        self.days = sorted(set(days))
+        self.sender = sender or RateLimitedSender(bot)
+        self.task = PeriodicTask('medbook-reminders', interval, self.run_once)
+
+    def start(self):
+        self.task.start()
+
+    async def stop(self):
+        await self.task.stop()
+
+    async def run_once(self, today=None):
+        # Один проход: выбираем всех, кому пора напомнить, и отправляем через лимитированный sender.
+        # Возвращает количество доставленных напоминаний
+        today = today or date.today()
+        due = await get_due_reminders_async(self.days, today)
+        if not due:
+            return 0
+        logger.info(f"⏰ Напоминаний к отправке: {len(due)}")
+        semaphore = asyncio.Semaphore(REMINDER_CONCURRENCY)
+
+        async def remind(telegram_id, full_name, expiry, days_before):
+            async with semaphore:
+                days_left = (date.fromisoformat(expiry) - today).days
+                text = (
+                    f"⚠️ {full_name}, срок медкнижки истекает {format_date_for_user(expiry)} "
+                    f"(осталось дней: {days_left}).\n\n"
+                    "После продления нажмите «🔄 Обновить медкнижку»."
+                )
+                if await self.sender.send(telegram_id, text):
+                    covered = [d for d in self.days if d >= days_before]
+                    await mark_reminder_sent_async(telegram_id, expiry, covered)
+                    return True
+                return False
+
+        results = await asyncio.gather(*(remind(*row) for row in due))
+        sent = sum(results)
+        logger.info(f"✅ Отправлено напоминаний: {sent} из {len(due)}")
+        return sent
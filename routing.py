@@ -0,0 +1,41 @@
+from aiogram.filters import BaseFilter
+from aiogram.types import CallbackQuery, Message
+
+# Маршрутизация без перебора фильтров: кнопки меню ищутся по точному тексту,
+# inline-кнопки — по префиксу callback_data (часть до первого ':'), оба — одним поиском в словаре
+
+def button_text(message: Message):
+    return message.text
+
+def callback_prefix(callback: CallbackQuery):
+    return (callback.data or '').split(':', 1)[0]
+
+class HandlerTable(BaseFilter):
+    # Фильтр-таблица: ключ апдейта → хендлер. На роутере регистрируется один раз вместе с dispatch,
+    # найденный хендлер передаётся в dispatch через данные фильтра
+    def __init__(self, key):
+        self.key = key
+        self.handlers = {}
+
+    def register(self, *keys):
+        def decorator(func):
+            for key in keys:
+                self.handlers[key] = func
+            return func
+        return decorator
+
+    async def __call__(self, event):
+        handler = self.handlers.get(self.key(event))
+        return False if handler is None else {'table_handler': handler}
+
+async def dispatch(event, state, table_handler):
+    # Все хендлеры из таблиц принимают (event, state)
+    return await table_handler(event, state)
+
+class UserIdFilter(BaseFilter):
+    # Фильтр уровня роутера: проверяется один раз на апдейт, а не в каждом хендлере
+    def __init__(self, user_ids):
+        self.user_ids = frozenset(user_ids)
+
+    async def __call__(self, event):
+        return event.from_user is not None and event.from_user.id in self.user_ids
@@ -0,0 +1,102 @@
+import os
+from difflib import SequenceMatcher
+
+from database import blacklist_keys, get_blacklist_entries, get_blacklist_entries_async, get_blacklist_keys_async, get_counter_async
+from utils import normalize_birth_date, normalize_phone
+
+# Насколько похожим должно быть ФИО, чтобы считаться совпадением с записью ЧС
+SCREEN_FUZZY_THRESHOLD = float(os.getenv('SCREEN_FUZZY_THRESHOLD', '0.85'))
+# Сколько кандидатов максимум сверяем по ФИО за одну проверку (защита от очень частых имён)
+SCREEN_MAX_CANDIDATES = int(os.getenv('SCREEN_MAX_CANDIDATES', '200'))
+
+class BlacklistScreen:
+    # Фильтр в памяти по ключам чёрного списка: телефон, ФИО, дата рождения и отдельные слова ФИО.
+    # Проверка регистрации — несколько поисков в словарях; в базу идём только за кандидатами
+    def __init__(self):
+        self.version = None
+        self._reset()
+
+    def _reset(self):
+        self._by_phone = {}
+        self._by_name = {}
+        self._by_birth = {}
+        self._by_word = {}
+
+    @staticmethod
+    def _put(index, key, row_id):
+        if key:
+            index.setdefault(key, set()).add(row_id)
+
+    def add(self, row_id, name_key, phone_key, birth_key):
+        self._put(self._by_phone, phone_key, row_id)
+        self._put(self._by_name, name_key, row_id)
+        self._put(self._by_birth, birth_key, row_id)
+        for word in (name_key or '').split():
+            if len(word) > 2:
+                self._put(self._by_word, word, row_id)
+
+    async def load(self):
+        # Версию читаем до ключей: изменение, пришедшее между запросами, вызовет ещё одну перезагрузку
+        version = await get_counter_async('blacklist_version')
+        rows = await get_blacklist_keys_async()
+        self._reset()
+        for row in rows:
+            self.add(*row)
+        self.version = version
+
+    async def refresh(self):
+        # Для воркеров кластера: ЧС мог изменить другой процесс. True — фильтр перечитан
+        if await get_counter_async('blacklist_version') == self.version:
+            return False
+        await self.load()
+        return True
+
+    def candidates(self, name_key=None, phone_key=None, birth_key=None):
+        # (точные совпадения по телефону/ФИО, кандидаты для нечёткой сверки ФИО)
+        exact = self._by_phone.get(phone_key, set()) | self._by_name.get(name_key, set())
+        maybe = set(self._by_birth.get(birth_key, set()))
+        for word in (name_key or '').split():
+            maybe |= self._by_word.get(word, set())
+        return exact, maybe - exact
+
+    def _candidate_ids(self, full_name, phone, birth_date):
+        keys = blacklist_keys(full_name or '', phone, birth_date)
+        exact, maybe = self.candidates(*keys)
+        return keys, list(exact) + list(maybe)[:SCREEN_MAX_CANDIDATES]
+
+    @staticmethod
+    def _match(keys, entries):
+        name_key, phone_key, birth_key = keys
+        matches = []
+        for row_id, bl_name, bl_phone, bl_birth, reason, bl_name_key in entries:
+            signs = []
+            if phone_key and normalize_phone(bl_phone) == phone_key:
+                signs.append('телефон')
+            if name_key and bl_name_key == name_key:
+                signs.append('ФИО')
+            elif name_key and bl_name_key:
+                ratio = SequenceMatcher(None, name_key, bl_name_key).ratio()
+                if ratio >= SCREEN_FUZZY_THRESHOLD:
+                    signs.append(f'ФИО похоже ({ratio:.0%})')
+            # Одна дата рождения — не повод для тревоги, только подтверждение других признаков
+            if signs and birth_key and normalize_birth_date(bl_birth) == birth_key:
+                signs.append('дата рождения')
+            if signs:
+                matches.append((row_id, bl_name, bl_phone, bl_birth, reason, signs))
+        return matches
+
+    async def check(self, full_name=None, phone=None, birth_date=None):
+        # Список совпадений: (id, ФИО, телефон, дата рождения, причина ЧС, [признаки совпадения])
+        keys, ids = self._candidate_ids(full_name, phone, birth_date)
+        if not ids:
+            return []
+        return self._match(keys, await get_blacklist_entries_async(ids))
+
+    def check_sync(self, full_name=None, phone=None, birth_date=None):
+        # То же для блокирующего кода в потоке пула (импорт файла)
+        keys, ids = self._candidate_ids(full_name, phone, birth_date)
+        if not ids:
+            return []
+        return self._match(keys, get_blacklist_entries(ids))
+
+blacklist_screen = BlacklistScreen()
@@ -0,0 +1,190 @@
+import asyncio
+import contextvars
+import logging
+import os
+import time
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import (
+    TelegramAPIError, TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram: ~30 сообщений в секунду на бота и не чаще 1 сообщения в секунду в один чат
+SEND_GLOBAL_RATE = float(os.getenv('SEND_GLOBAL_RATE', '25'))
+SEND_CHAT_INTERVAL = float(os.getenv('SEND_CHAT_INTERVAL', '1.0'))
+SEND_MAX_RETRIES = int(os.getenv('SEND_MAX_RETRIES', '3'))
+# Предел длины одного сообщения Telegram: склеенные уведомления в него укладываются
+MESSAGE_LIMIT = 4096
+
+# Очереди исходящих: ответы пользователю в хендлерах идут раньше массовых рассылок
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+LANES = (INTERACTIVE, BULK)
+# Методы Bot API, которые расходуют лимит сообщений
+LIMITED_METHODS = frozenset({
+    'SendMessage', 'SendDocument', 'SendPhoto', 'SendMediaGroup', 'CopyMessage', 'ForwardMessage', 'EditMessageText',
+})
+
+outbound_messages = Counter('bot_outbound_messages_total', 'Исходящие сообщения: sent, failed, retried, coalesced', ('lane', 'result'))
+
+# Выставляется, пока сообщение отправляет сам RateLimitedSender: middleware сессии его не лимитирует повторно
+_sender_call = contextvars.ContextVar('sender_call', default=False)
+
+class PriorityBucket:
+    # Общий token bucket бота. Пока токена ждёт хотя бы одно интерактивное сообщение,
+    # массовые не получают токенов — рассылка не задерживает ответы в хендлерах.
+    # Во время паузы flood control токенов не получает никто, даже те, кто уже ждёт в acquire
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.waiting = dict.fromkeys(LANES, 0)
+        self.paused_until = 0.0
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, lane=BULK):
+        self.waiting[lane] += 1
+        try:
+            while True:
+                now = time.monotonic()
+                if self.paused_until > now:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1 and (lane == INTERACTIVE or not self.waiting[INTERACTIVE]):
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep(max((1 - self.tokens) / self.rate, 0.005))
+        finally:
+            self.waiting[lane] -= 1
+
+class OutboundMessage:
+    def __init__(self, chat_id, text, lane, kwargs):
+        self.chat_id = chat_id
+        self.text = text
+        self.lane = lane
+        self.kwargs = kwargs
+        self.future = asyncio.get_running_loop().create_future()
+
+class RateLimitedSender:
+    # Центральный отправитель: общий лимит с приоритетом интерактивных ответов, интервал между
+    # сообщениями в один чат, пауза всего отправителя при 429 (retry_after) и повтор вместо потери.
+    # Массовые сообщения в один чат, ещё ждущие своей очереди, склеиваются в одно
+    def __init__(self, bot, global_rate=SEND_GLOBAL_RATE, chat_interval=SEND_CHAT_INTERVAL, max_retries=SEND_MAX_RETRIES):
+        self.bot = bot
+        self.bucket = PriorityBucket(global_rate)
+        self.chat_interval = chat_interval
+        self.max_retries = max_retries
+        self.queued = dict.fromkeys(LANES, 0)
+        self._pending = {}
+        self._chat_next = {}
+
+    def register_metrics(self):
+        Gauge('bot_outbound_queue_depth', 'Исходящих сообщений ждут отправки', lambda: {(lane,): n for lane, n in self.queued.items()}, ('lane',))
+
+    def pause(self, retry_after):
+        logger.warning(f"⏳ Flood control: пауза {retry_after} с")
+        self.bucket.pause(retry_after)
+
+    async def wait_turn(self, chat_id, lane=BULK):
+        # Пауза flood control проверяется в bucket.acquire — последним шагом перед отправкой.
+        # Резервируем слот в чате до ожидания, чтобы параллельные отправки в один чат выстроились в очередь.
+        # Интерактивный ответ не ждёт слота (пользователь ждёт ответа), но сдвигает его для рассылки
+        now = time.monotonic()
+        slot = max(now, self._chat_next.get(chat_id, 0.0)) if chat_id is not None else now
+        if chat_id is not None:
+            self._chat_next[chat_id] = (now if lane == INTERACTIVE else slot) + self.chat_interval
+        if lane == BULK and slot > now:
+            await asyncio.sleep(slot - now)
+        await self.bucket.acquire(lane)
+        if len(self._chat_next) > 10000:
+            self._chat_next = {cid: t for cid, t in self._chat_next.items() if t > now}
+
+    async def send(self, chat_id, text, lane=BULK, **kwargs):
+        # True — сообщение доставлено, False — доставить нельзя (бот заблокирован, ошибки исчерпали попытки)
+        pending = self._pending.get(chat_id) if lane == BULK and not kwargs else None
+        if pending is not None and len(pending.text) + len(text) + 2 <= MESSAGE_LIMIT:
+            pending.text += '\n\n' + text
+            outbound_messages.inc(lane, 'coalesced')
+            return await asyncio.shield(pending.future)
+        message = OutboundMessage(chat_id, text, lane, kwargs)
+        if lane == BULK and not kwargs:
+            self._pending[chat_id] = message
+        self.queued[lane] += 1
+        delivered = False
+        try:
+            delivered = await self._deliver(message)
+            return delivered
+        finally:
+            self.queued[lane] -= 1
+            if self._pending.get(chat_id) is message:
+                del self._pending[chat_id]
+            message.future.set_result(delivered)
+
+    async def _deliver(self, message):
+        token = _sender_call.set(True)
+        try:
+            for attempt in range(self.max_retries + 1):
+                await self.wait_turn(message.chat_id, message.lane)
+                # С этого момента текст зафиксирован: новые сообщения в этот чат пойдут следующим
+                if self._pending.get(message.chat_id) is message:
+                    del self._pending[message.chat_id]
+                try:
+                    await self.bot.send_message(message.chat_id, message.text, **message.kwargs)
+                    outbound_messages.inc(message.lane, 'sent')
+                    return True
+                except TelegramRetryAfter as e:
+                    self.pause(e.retry_after)
+                    outbound_messages.inc(message.lane, 'retried')
+                except (TelegramForbiddenError, TelegramBadRequest) as e:
+                    logger.info(f"Сообщение в чат {message.chat_id} не доставлено: {e}")
+                    break
+                except (TelegramNetworkError, TelegramServerError) as e:
+                    # Сбой сети или 5xx на стороне Telegram — временные, повторяем с паузой
+                    logger.warning(f"Временная ошибка при отправке в {message.chat_id}: {e}")
+                    outbound_messages.inc(message.lane, 'retried')
+                    await asyncio.sleep(2 ** attempt)
+                except TelegramAPIError as e:
+                    # Прочие ответы API не должны обрывать рассылку: сообщение считается недоставленным
+                    logger.error(f"Ошибка API при отправке в {message.chat_id}: {e}")
+                    break
+            outbound_messages.inc(message.lane, 'failed')
+            return False
+        finally:
+            _sender_call.reset(token)
+
+class FloodControlMiddleware(BaseRequestMiddleware):
+    # Middleware сессии бота: message.answer и прочие ответы хендлеров проходят через тот же
+    # лимит, что и рассылки, в интерактивной очереди, а при 429 ждут и повторяются, а не теряются
+    def __init__(self, sender):
+        self.sender = sender
+
+    async def __call__(self, make_request, bot, method):
+        if _sender_call.get() or type(method).__name__ not in LIMITED_METHODS:
+            return await make_request(bot, method)
+        chat_id = getattr(method, 'chat_id', None)
+        self.sender.queued[INTERACTIVE] += 1
+        try:
+            for attempt in range(self.sender.max_retries + 1):
+                await self.sender.wait_turn(chat_id, INTERACTIVE)
+                try:
+                    response = await make_request(bot, method)
+                    outbound_messages.inc(INTERACTIVE, 'sent')
+                    return response
+                except TelegramRetryAfter as e:
+                    self.sender.pause(e.retry_after)
+                    outbound_messages.inc(INTERACTIVE, 'retried')
+                    if attempt == self.sender.max_retries:
+                        outbound_messages.inc(INTERACTIVE, 'failed')
+                        raise
+        finally:
+            self.sender.queued[INTERACTIVE] -= 1
@@ -0,0 +1,64 @@
+import re
+from datetime import datetime
+
+# Проверки и преобразования дат/телефонов, общие для бота, выгрузки и импорта
+
+def validate_date(date_text):
+    try:
+        datetime.strptime(date_text, '%d.%m.%Y')
+        return True
+    except ValueError:
+        return False
+
+def validate_phone(phone):
+    phone = phone.replace(' ', '').replace('-', '').replace('(', '').replace(')', '')
+    return phone.startswith('+7') and len(phone) == 12 and phone[2:].isdigit()
+
+def format_date_for_db(date_text):
+    d = datetime.strptime(date_text, '%d.%m.%Y')
+    return d.strftime('%Y-%m-%d')
+
+def format_date_for_user(date_text):
+    try:
+        d = datetime.strptime(date_text, '%Y-%m-%d')
+        return d.strftime('%d.%m.%Y')
+    except:
+        return date_text
+
+# Нормализованные ключи для сравнения людей (поиск, проверка по чёрному списку)
+
+def normalize_name(text):
+    return text.lower().replace('ё', 'е')
+
+def name_key(full_name):
+    # «Иванов  Иван» и «иван ИВАНОВ» дают один ключ: слова в нижнем регистре, по алфавиту
+    return ' '.join(sorted(re.findall(r'\w+', normalize_name(full_name))))
+
+def normalize_phone(phone):
+    # Только цифры в формате 7XXXXXXXXXX: «8 (999) 123-45-67» → «79991234567»
+    digits = re.sub(r'\D', '', phone or '')
+    if digits.startswith('8'):
+        digits = '7' + digits[1:]
+    elif digits.startswith('9'):
+        digits = '7' + digits
+    return digits or None
+
+def format_phone_for_db(phone):
+    # Единый вид телефона в staff: «+7 (999) 123-45-67» → «+79991234567». По нему строится поисковый индекс
+    digits = normalize_phone(phone)
+    return '+' + digits if digits else phone
+
+def normalize_birth_date(date_text):
+    # ДД.ММ.ГГГГ или ГГГГ-ММ-ДД → ГГГГ-ММ-ДД; нераспознанное — None
+    if not date_text:
+        return None
+    if validate_date(date_text):
+        return format_date_for_db(date_text)
+    try:
+        return datetime.strptime(date_text, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+def blacklist_keys(full_name, phone, birth_date):
+    # Нормализованные ключи записи ЧС для быстрой проверки новых регистраций (см. screening.py)
+    return name_key(full_name), normalize_phone(phone), normalize_birth_date(birth_date)
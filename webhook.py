@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import os
+import secrets
+import signal
+
+from aiohttp import web
+from aiogram.types import Update
+
+from metrics import Gauge, add_metrics_route
+
+logger = logging.getLogger(__name__)
+
+# Публичный адрес для setWebhook; если пуст — сервер поднимается без регистрации
+# вебхука (удобно для локальной проверки POST-запросами с записанными Update)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+# Секрет в заголовке X-Telegram-Bot-Api-Secret-Token: без него любой мог бы прислать поддельный
+# апдейт от имени админа. Если не задан — генерируется при старте и передаётся в setWebhook
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('PORT', '8080'))
+# Сколько апдейтов обрабатывается параллельно и сколько может ждать в очереди
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '16'))
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))
+# Сколько секунд ждать места в очереди, прежде чем ответить 503 (Telegram повторит доставку)
+WEBHOOK_ENQUEUE_TIMEOUT = float(os.getenv('WEBHOOK_ENQUEUE_TIMEOUT', '5'))
+# Сколько секунд при остановке даём на обработку уже принятых апдейтов
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv('WEBHOOK_DRAIN_TIMEOUT', '30'))
+
+class UpdateQueue:
+    # Принимает апдейты от Telegram и сразу отвечает 200, а обработку выполняют
+    # WEBHOOK_WORKERS фоновых задач. Очередь ограничена: при переполнении — 503
+    def __init__(self, dp, bot, secret=WEBHOOK_SECRET, workers=WEBHOOK_WORKERS, maxsize=WEBHOOK_QUEUE_SIZE):
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret or secrets.token_urlsafe(32)
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.workers_count = workers
+        self.workers = []
+        self.closing = False
+
+    def start(self):
+        Gauge('webhook_queue_depth', 'Апдейтов в очереди на обработку', lambda: {(): self.queue.qsize()})
+        self.workers = [asyncio.create_task(self._worker(), name=f'webhook-worker-{i}') for i in range(self.workers_count)]
+
+    async def handle(self, request):
+        token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if not secrets.compare_digest(token.encode(), self.secret.encode()):
+            return web.Response(status=401)
+        if self.closing:
+            return web.Response(status=503)
+        try:
+            update = Update.model_validate(await request.json(), context={'bot': self.bot})
+        except ValueError:
+            return web.Response(status=400)
+        try:
+            await asyncio.wait_for(self.queue.put(update), WEBHOOK_ENQUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ Очередь апдейтов переполнена, отвечаем 503")
+            return web.Response(status=503)
+        return web.Response()
+
+    async def _worker(self):
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception:
+                logger.exception(f"❌ Ошибка обработки апдейта {update.update_id}")
+            finally:
+                self.queue.task_done()
+
+    async def drain(self, timeout=WEBHOOK_DRAIN_TIMEOUT):
+        # Перестаём принимать новые апдейты и даём доработать уже принятым
+        self.closing = True
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Не обработано апдейтов при остановке: {self.queue.qsize()}")
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+def create_app(updates):
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, updates.handle)
+    add_metrics_route(app)
+    return app
+
+async def run_webhook(dp, bot, feeder=None):
+    # feeder — куда отдавать апдейты вместо dp (в кластерном режиме это ShardedFeeder, см. cluster.py)
+    updates = UpdateQueue(feeder or dp, bot)
+    app = create_app(updates)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await dp.emit_startup(bot=bot)
+    updates.start()
+    await site.start()
+    logger.info(f"🌐 Webhook-сервер слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+            secret_token=updates.secret,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+    else:
+        logger.warning("⚠️ WEBHOOK_URL не задан — setWebhook не вызывается")
+        if not WEBHOOK_SECRET:
+            logger.warning("⚠️ WEBHOOK_SECRET не задан: апдейты без заголовка с секретом отклоняются, для ручной проверки задайте его явно")
+    try:
+        await stop.wait()
+    finally:
+        logger.info("⏳ Останавливаем приём апдейтов...")
+        await updates.drain()
+        await runner.cleanup()
+        await dp.emit_shutdown(bot=bot)